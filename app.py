@@ -1,15 +1,40 @@
+import logging
+import os
 from flask import Flask, render_template
-from flask_mysqldb import MySQL
-from flask_login import LoginManager, UserMixin
+from jinja2 import FileSystemBytecodeCache
+from flask_login import LoginManager
+from werkzeug.middleware.proxy_fix import ProxyFix
 from config import Config
+from db import MySQLPool
+from cache import TTLCache
+from page_cache import init_page_cache, page_cache, seat_cache
+from images import init_images
+from uploads import init_uploads
+from assets import init_assets
+from passwords import PasswordHasher
+from seat_stream import seat_publisher
+from metrics import Metrics
+from ratelimit import RateLimiter
 import MySQLdb.cursors
 
 # Initialize extensions
-mysql = MySQL()
+mysql = MySQLPool()
 login_manager = LoginManager()
+user_cache = TTLCache()
+password_hasher = PasswordHasher()
+metrics = Metrics()
+rate_limiter = RateLimiter()
 
 # User class definition
-class User(UserMixin):
+class User:
+    # Loaded on every authenticated request and kept in user_cache,
+    # so keep instances small
+    __slots__ = ('id', 'username', 'email', 'role')
+
+    is_authenticated = True
+    is_active = True
+    is_anonymous = False
+
     def __init__(self, user_data):
         self.id = user_data['id']
         self.username = user_data['username']
@@ -19,9 +44,26 @@ class User(UserMixin):
     def get_id(self):
         return str(self.id)
 
-def create_app():
+    def __eq__(self, other):
+        if isinstance(other, User):
+            return self.id == other.id
+        return NotImplemented
+
+def create_app(config_class=Config):
     app = Flask(__name__)
-    app.config.from_object(Config)
+    app.config.from_object(config_class)
+    if app.config.get('PROXY_FIX_X_FOR'):
+        # Take the client address from X-Forwarded-For, as set by that many proxies
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config['PROXY_FIX_X_FOR'])
+    if app.config.get('JINJA_CACHE_DIR'):
+        # Compiled templates are kept on disk, so a fresh process loads them
+        # instead of compiling them again
+        os.makedirs(app.config['JINJA_CACHE_DIR'], exist_ok=True)
+        app.jinja_options = {**app.jinja_options,
+                             'bytecode_cache': FileSystemBytecodeCache(app.config['JINJA_CACHE_DIR'])}
+    # No-op if the server (or a test) already configured logging
+    logging.basicConfig(level=app.config.get('LOG_LEVEL', 'INFO'),
+                        format='%(asctime)s %(levelname)s [%(process)d] %(name)s: %(message)s')
 
     # Initialize Flask extensions
     mysql.init_app(app)
@@ -32,26 +74,54 @@ def create_app():
     # Optional: If you don't want redirection on unauthorized views
     login_manager.login_view_unauthorized_handler = lambda: None
 
+    user_cache.init_app(app, 'USER_CACHE')
+    password_hasher.init_app(app)
+    rate_limiter.init_app(app)
+    init_page_cache(app)
+    seat_publisher.init_app(app)
+    init_images(app)
+    init_uploads(app)
+    init_assets(app)
+    metrics.init_app(app, gauges={
+        'mysql_pool': lambda: app.extensions['mysql_pool'].stats(),
+        'mysql_replicas': lambda: app.extensions['mysql_replicas'].stats()
+                          if app.extensions['mysql_replicas'] else {},
+        'user_cache': user_cache.stats,
+        'page_cache': page_cache.stats,
+        'seat_cache': seat_cache.stats,
+        'password_hashing': password_hasher.stats,
+        'rate_limit': rate_limiter.stats,
+        'seat_stream': seat_publisher.stats,
+    })
+
     # User loader function
     @login_manager.user_loader
     def load_user(user_id):
+        user = user_cache.get(user_id)
+        if user is not None:
+            return user
+
         cursor = mysql.connection.cursor(MySQLdb.cursors.DictCursor)
-        cursor.execute('SELECT * FROM users WHERE id = %s', (user_id,))
+        cursor.execute('SELECT id, username, email, role FROM users WHERE id = %s', (user_id,))
         user_data = cursor.fetchone()
         cursor.close()
         
         if user_data:
-            return User(user_data)
+            user = User(user_data)
+            user_cache.set(user_id, user)
+            return user
         return None
 
     # Import and register blueprints
     from routes.auth_routes import auth_bp
     from routes.main_routes import main_bp
     from routes.admin_routes import admin_bp
+    from routes.api_routes import api_bp
 
     app.register_blueprint(auth_bp)
     app.register_blueprint(main_bp)
     app.register_blueprint(admin_bp)
+    app.register_blueprint(api_bp)
 
     # Error handlers
     @app.errorhandler(404)
@@ -62,6 +132,15 @@ def create_app():
         <a href="/">Return to Home</a>
         """, 404
 
+    @app.errorhandler(429)
+    def too_many_requests(error):
+        retry_after = error.retry_after or 1
+        return f"""
+        <h1>429 - Too Many Requests</h1>
+        <p>Too many attempts. Please try again in {retry_after} seconds.</p>
+        <a href="/">Return to Home</a>
+        """, 429, {'Retry-After': str(retry_after)}
+
     @app.errorhandler(500)
     def internal_error(error):
         mysql.connection.rollback()
@@ -73,6 +152,20 @@ def create_app():
 
     return app
 
+def warm_up(app):
+    """Do the work the first requests would otherwise pay for.
+
+    Run by wsgi.py. Under gunicorn's preload_app this happens once in the
+    master, and every forked worker starts with the templates compiled and
+    the URL map built.
+    """
+    env = app.jinja_env
+    for name in env.list_templates(extensions=('html',)):
+        env.get_template(name)
+    app.url_map.update()
+    # Workers must not inherit open connections from the master
+    mysql.dispose(app)
+
 if __name__ == '__main__':
     app = create_app()
     
@@ -0,0 +1,128 @@
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import shutil
+
+from flask import request, send_file, send_from_directory
+from werkzeug.exceptions import NotFound
+from werkzeug.utils import safe_join
+
+try:
+    import brotli
+except ImportError:  # brotli variants are skipped without it
+    brotli = None
+
+DIST_DIR = 'dist'
+MANIFEST_NAME = 'asset-manifest.json'
+# Uploads are already content-addressed and served by their own rules
+SKIP_DIRS = {DIST_DIR, 'uploads'}
+COMPRESSIBLE = {'.css', '.js', '.svg', '.json', '.txt', '.html', '.map', '.ico'}
+FINGERPRINT_MAX_AGE = 365 * 24 * 3600
+# Accept-Encoding token -> suffix of the precompressed file, in preference order
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+
+def _fingerprinted_name(relative_path, digest):
+    stem, ext = os.path.splitext(relative_path)
+    return f'{DIST_DIR}/{stem}.{digest[:12]}{ext}'
+
+
+def build(static_dir):
+    """Copy static assets to dist/ under hashed names and precompress them.
+
+    Writes asset-manifest.json mapping each original path to its
+    fingerprinted one. Run at deploy time: python assets.py
+    """
+    dist_dir = os.path.join(static_dir, DIST_DIR)
+    shutil.rmtree(dist_dir, ignore_errors=True)
+    manifest = {}
+
+    for root, dirs, files in os.walk(static_dir):
+        rel_root = os.path.relpath(root, static_dir)
+        if rel_root == '.':
+            dirs[:] = [d for d in dirs if d not in SKIP_DIRS]
+        for name in files:
+            if name == MANIFEST_NAME:
+                continue
+            source = os.path.join(root, name)
+            relative = os.path.normpath(os.path.join(rel_root, name)).replace(os.sep, '/')
+            with open(source, 'rb') as f:
+                data = f.read()
+
+            hashed = _fingerprinted_name(relative, hashlib.sha256(data).hexdigest())
+            target = os.path.join(static_dir, hashed)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            shutil.copyfile(source, target)
+
+            if os.path.splitext(name)[1].lower() in COMPRESSIBLE:
+                with open(target + '.gz', 'wb') as f:
+                    f.write(gzip.compress(data, compresslevel=9, mtime=0))
+                if brotli is not None:
+                    with open(target + '.br', 'wb') as f:
+                        f.write(brotli.compress(data, quality=11))
+            manifest[relative] = hashed
+
+    with open(os.path.join(static_dir, MANIFEST_NAME), 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    return manifest
+
+
+def load_manifest(static_dir):
+    try:
+        with open(os.path.join(static_dir, MANIFEST_NAME)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def init_assets(app):
+    manifest = load_manifest(app.static_folder)
+    app.extensions['asset_manifest'] = manifest
+
+    @app.url_defaults
+    def fingerprint_static_urls(endpoint, values):
+        # url_for('static', filename='style.css') -> /static/dist/style.<hash>.css
+        if endpoint == 'static':
+            hashed = manifest.get(values.get('filename'))
+            if hashed:
+                values['filename'] = hashed
+
+    def serve_static(filename):
+        if not filename.startswith(DIST_DIR + '/'):
+            return send_from_directory(app.static_folder, filename)
+
+        # Fingerprinted names never change content, so they can be cached forever
+        path = safe_join(app.static_folder, filename)
+        if path is None or not os.path.isfile(path):
+            raise NotFound()
+        mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+
+        response = None
+        for encoding, suffix in ENCODINGS:
+            if request.accept_encodings[encoding] and os.path.isfile(path + suffix):
+                # send_file hands the open file to the server's wsgi.file_wrapper,
+                # which gunicorn serves with sendfile()
+                response = send_file(path + suffix, mimetype=mimetype,
+                                     max_age=FINGERPRINT_MAX_AGE, conditional=True)
+                response.headers['Content-Encoding'] = encoding
+                break
+        if response is None:
+            response = send_file(path, mimetype=mimetype, max_age=FINGERPRINT_MAX_AGE,
+                                 conditional=True)
+
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+        response.vary.add('Accept-Encoding')
+        return response
+
+    app.view_functions['static'] = serve_static
+
+
+if __name__ == '__main__':
+    from config import BASE_DIR
+
+    built = build(os.path.join(BASE_DIR, 'static'))
+    print(f"Fingerprinted {len(built)} asset(s)"
+          + ('' if brotli else ' (install brotli for .br variants)'))
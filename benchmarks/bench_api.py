@@ -0,0 +1,52 @@
+"""What a polling client costs: scraping HTML versus the JSON API.
+
+Times a logged-in main.index render (scrapers send their session cookie, so
+they miss the page cache), /api/events in full and with ?fields=, a
+conditional GET that comes back 304, and one ?ids= batch lookup against the
+same number of event_details pages.
+
+    python -m benchmarks.bench_api --events 200
+"""
+import argparse
+
+from benchmarks.common import create_bench_app, login_as, reset_database, seed, timed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--events', type=int, default=200)
+    parser.add_argument('--batch', type=int, default=20, help='events per ?ids= lookup')
+    args = parser.parse_args()
+
+    reset_database()
+    seed(events=args.events, users=10, registrations_per_event=5)
+    app = create_bench_app()
+    scraper = app.test_client()
+    login_as(scraper, 1)
+    client = app.test_client()
+
+    etag = client.get('/api/events').headers['ETag']
+    ids = ','.join(str(i) for i in range(1, args.batch + 1))
+
+    def details_pages():
+        for event_id in range(1, args.batch + 1):
+            scraper.get(f'/event/{event_id}')
+
+    cases = [
+        ('html main.index', lambda: scraper.get('/')),
+        ('api /events', lambda: client.get('/api/events')),
+        ('api ?fields=id,seats_left', lambda: client.get('/api/events?fields=id,seats_left')),
+        ('api If-None-Match (304)', lambda: client.get('/api/events', headers={'If-None-Match': etag})),
+        (f'html {args.batch} event pages', details_pages),
+        (f'api ?ids= ({args.batch})', lambda: client.get(f'/api/events?ids={ids}')),
+    ]
+    print(f"{'request':<28} {'p50':>9} {'p95':>9} {'bytes':>8}")
+    for name, fn in cases:
+        response = fn()
+        size = len(response.get_data()) if response is not None else '-'
+        result = timed(fn)
+        print(f"{name:<28} {result['p50_ms']:>7.2f}ms {result['p95_ms']:>7.2f}ms {size:>8}")
+
+
+if __name__ == '__main__':
+    main()
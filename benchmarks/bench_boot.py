@@ -0,0 +1,163 @@
+"""Worker cold start and first-request latency, with and without preload_app.
+
+Runs gunicorn with gunicorn.conf.py on benchmarks.wsgi:app, once with
+GUNICORN_PRELOAD=0 and once with GUNICORN_PRELOAD=1, and reports:
+
+  - how long the master took to become ready and each worker took to boot,
+    from the lines gunicorn.conf.py logs, plus the wall time from launch
+    until all --workers were up;
+  - for every route, the latency of its first request on a freshly forked
+    worker next to a second, warm request. The server runs one worker here,
+    which is killed before each route so that the master forks a new one.
+
+    python -m benchmarks.bench_boot --workers 4
+"""
+import argparse
+import http.client
+import os
+import queue
+import re
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+from benchmarks.common import ROOT
+from benchmarks.loadtest import build_scenarios, percentile, prepare_data, session_cookies
+
+MASTER_READY_RE = re.compile(r'Master ready in ([\d.]+)ms')
+WORKER_BOOTED_RE = re.compile(r'Worker (\d+) booted in ([\d.]+)ms')
+
+
+class Server:
+    def __init__(self, port, workers, preload):
+        self.port = port
+        env = dict(os.environ, GUNICORN_PRELOAD='1' if preload else '0')
+        command = [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'benchmarks.wsgi:app',
+                   '--bind', f'127.0.0.1:{port}', '--workers', str(workers), '--log-level', 'info']
+        self.started = time.perf_counter()
+        self.process = subprocess.Popen(command, cwd=ROOT, env=env, stderr=subprocess.PIPE, text=True)
+        self.lines = queue.Queue()
+        threading.Thread(target=self._read, daemon=True).start()
+
+    def _read(self):
+        for line in self.process.stderr:
+            self.lines.put((time.perf_counter(), line))
+
+    def wait_for(self, pattern, timeout=60):
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                at, line = self.lines.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                self.stop()
+                raise SystemExit(f'gunicorn did not log {pattern.pattern!r} within {timeout}s')
+            match = pattern.search(line)
+            if match:
+                return at, match
+
+    def wait_for_workers(self, count):
+        """[(pid, boot ms)] for the next `count` workers to boot."""
+        booted = []
+        while len(booted) < count:
+            at, match = self.wait_for(WORKER_BOOTED_RE)
+            booted.append((int(match.group(1)), float(match.group(2))))
+        return booted, at
+
+    def stop(self):
+        self.process.terminate()
+        self.process.wait()
+
+
+def send(port, spec):
+    method, path, body, cookie, headers = spec
+    headers = dict(headers)
+    if cookie:
+        headers['Cookie'] = cookie
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+    start = time.perf_counter()
+    conn.request(method, path, body=body, headers=headers)
+    response = conn.getresponse()
+    response.read()
+    elapsed = time.perf_counter() - start
+    conn.close()
+    return elapsed * 1000, response.status
+
+
+def cold_start(args, preload):
+    server = Server(args.port, args.workers, preload)
+    try:
+        _, match = server.wait_for(MASTER_READY_RE)
+        master_ms = float(match.group(1))
+        booted, last_at = server.wait_for_workers(args.workers)
+    finally:
+        server.stop()
+    boot_times = [ms / 1000 for _, ms in booted]
+    return {
+        'master_ms': master_ms,
+        'worker_p50_ms': percentile(boot_times, 50),
+        'worker_max_ms': max(boot_times) * 1000,
+        'all_up_ms': (last_at - server.started) * 1000,
+    }
+
+
+def first_requests(args, preload, routes):
+    server = Server(args.port, 1, preload)
+    results = {}
+    try:
+        server.wait_for(MASTER_READY_RE)
+        [(pid, _)], _ = server.wait_for_workers(1)
+        for name, make_request in routes.items():
+            # A fresh worker for each route
+            os.kill(pid, signal.SIGTERM)
+            [(pid, boot_ms)], _ = server.wait_for_workers(1)
+            first_ms, status = send(args.port, make_request(0))
+            warm_ms, _ = send(args.port, make_request(1))
+            results[name] = (boot_ms, first_ms, warm_ms, status)
+    finally:
+        server.stop()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workers', type=int, default=4, help='workers for the cold start run')
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--events', type=int, default=50)
+    parser.add_argument('--port', type=int, default=8767)
+    args = parser.parse_args()
+    # Seeded like the load test, at a smaller scale
+    args.registrations, args.capacity, args.requests_pending = 20, 500, 50
+
+    admin_id, user_ids, event_ids = prepare_data(args)
+    cookies = session_cookies(user_ids)
+    routes = build_scenarios(admin_id, user_ids, event_ids, cookies)
+    student = cookies[user_ids[-1]]
+    routes.update({
+        'main.search': lambda i: ('GET', '/search?q=Bench', None, None, {}),
+        'main.my_registrations': lambda i: ('GET', '/my-registrations', None, student, {}),
+        'admin.dashboard': lambda i: ('GET', '/admin/dashboard', None, cookies[admin_id], {}),
+        'api.events': lambda i: ('GET', '/api/events', None, None, {}),
+    })
+
+    modes = [('no preload', False), ('preload', True)]
+    print(f"{'cold start':<12} {'master':>9} {'worker p50':>11} {'worker max':>11} {'all up':>9}")
+    for label, preload in modes:
+        result = cold_start(args, preload)
+        print(f"{label:<12} {result['master_ms']:>7.0f}ms {result['worker_p50_ms']:>9.0f}ms "
+              f"{result['worker_max_ms']:>9.0f}ms {result['all_up_ms']:>7.0f}ms")
+
+    by_mode = {label: first_requests(args, preload, routes) for label, preload in modes}
+    print()
+    print(f"{'first request':<28} " + ' '.join(f'{label + " boot/first/warm":>30}' for label, _ in modes))
+    for name in routes:
+        cells = []
+        for label, _ in modes:
+            boot_ms, first_ms, warm_ms, status = by_mode[label][name]
+            cells.append(f'{boot_ms:>6.0f} {first_ms:>7.1f} {warm_ms:>7.1f}ms ({status})')
+        print(f"{name:<28} " + ' '.join(f'{cell:>30}' for cell in cells))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""Registration export throughput and peak memory.
+
+Seeds one event with --attendees registrations and streams the CSV and XLSX
+exports through the test client, reporting rows/sec and the process's peak
+RSS. With --offline the writers are fed synthetic rows and no database is
+needed.
+
+    python -m benchmarks.bench_export --attendees 50000
+    python -m benchmarks.bench_export --offline
+"""
+import argparse
+import resource
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from exports import csv_chunks, xlsx_chunks
+
+
+def peak_rss_mb():
+    # ru_maxrss is KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def report(label, rows, nbytes, elapsed):
+    print(f"{label:>12}: {rows / elapsed:10.0f} rows/s  {nbytes / 1e6:7.1f} MB  "
+          f"peak RSS {peak_rss_mb():.0f} MB")
+
+
+def synthetic_rows(count):
+    now = datetime.now()
+    for i in range(count):
+        yield {'username': f'student{i}', 'email': f'student{i}@example.com',
+               'status': 'confirmed', 'registration_date': now}
+
+
+COLUMNS = [('username', 'Username'), ('email', 'Email'), ('status', 'Status'),
+           ('registration_date', 'Registered At')]
+
+
+def run_offline(count):
+    for label, writer in (('csv', csv_chunks), ('xlsx', xlsx_chunks)):
+        start = time.perf_counter()
+        nbytes = 0
+        for chunk in writer(synthetic_rows(count), COLUMNS):
+            nbytes += len(chunk)
+        report(label, count, nbytes, time.perf_counter() - start)
+
+
+def run_online(count):
+    from benchmarks.common import connect, create_bench_app, login_as, reset_database, seed
+
+    reset_database()
+    seed(events=1, users=count, registrations_per_event=count)
+    app = create_bench_app()
+
+    conn = connect()
+    cursor = conn.cursor()
+    cursor.execute("UPDATE users SET role = 'admin' WHERE username = 'bench0'")
+    cursor.execute("SELECT id FROM users WHERE username = 'bench0'")
+    (admin_id,) = cursor.fetchone()
+    cursor.execute('SELECT id FROM events LIMIT 1')
+    (event_id,) = cursor.fetchone()
+    conn.commit()
+    cursor.close()
+    conn.close()
+
+    client = app.test_client()
+    login_as(client, admin_id)
+    for export_format in ('csv', 'xlsx'):
+        start = time.perf_counter()
+        response = client.get(f'/admin/events/{event_id}/registrations/export?format={export_format}',
+                              buffered=False)
+        nbytes = sum(len(chunk) for chunk in response.response)
+        report(export_format, count, nbytes, time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--attendees', type=int, default=50000)
+    parser.add_argument('--offline', action='store_true')
+    args = parser.parse_args()
+
+    if args.offline:
+        run_offline(args.attendees)
+    else:
+        run_online(args.attendees)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,49 @@
+"""Homepage latency as registrations grow.
+
+Compares rendering main.index (which reads events.registered_count) with the
+old LEFT JOIN ... GROUP BY aggregate at increasing registration volumes.
+
+    python -m benchmarks.bench_homepage
+"""
+from benchmarks.common import (add_registrations, connect, create_bench_app,
+                               reset_database, seed, timed)
+
+EVENTS = 50
+STEPS = [0, 100, 1000, 5000]  # registrations per event
+
+LEGACY_QUERY = '''
+    SELECT e.*, COUNT(er.id) as registered_count
+    FROM events e
+    LEFT JOIN event_registrations er ON e.id = er.event_id
+    WHERE e.status = 'published' AND e.date >= CURDATE()
+    GROUP BY e.id
+    ORDER BY e.date ASC
+'''
+
+
+def main():
+    reset_database()
+    seed(events=EVENTS, users=max(STEPS))
+    app = create_bench_app()
+    client = app.test_client()
+    conn = connect()
+
+    def legacy():
+        cursor = conn.cursor()
+        cursor.execute(LEGACY_QUERY)
+        cursor.fetchall()
+        cursor.close()
+
+    print(f"{'registrations':>14} {'index p50':>10} {'index p95':>10} {'legacy agg p50':>15}")
+    for per_event in STEPS:
+        add_registrations(conn, per_event)
+        page = timed(lambda: client.get('/'))
+        agg = timed(legacy)
+        print(f"{per_event * EVENTS:>14} {page['p50_ms']:>9.2f}ms {page['p95_ms']:>9.2f}ms "
+              f"{agg['p50_ms']:>14.2f}ms")
+
+    conn.close()
+
+
+if __name__ == '__main__':
+    main()
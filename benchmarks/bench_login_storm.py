@@ -0,0 +1,109 @@
+"""Latency of ordinary pages during a login storm.
+
+Simulates a server with a fixed number of request threads and submits a
+burst of POST /login interleaved with GET /event/<id>. It reports the
+p50/p99 of the event page (queueing included) with no storm, with
+passwords checked on the request thread (PASSWORD_WORKERS = 0) and with
+the bounded hashing pool, plus how many logins succeeded or were turned
+away with 503.
+
+With --legacy-hashes the seeded users start with pbkdf2 hashes, and the
+run also checks that each successful login upgraded its user's hash.
+
+    python -m benchmarks.bench_login_storm --logins 400 --reads 400 --server-threads 16
+"""
+import argparse
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.security import generate_password_hash
+
+from benchmarks.common import BenchConfig, connect, reset_database, seed
+
+
+class InlineConfig(BenchConfig):
+    PASSWORD_WORKERS = 0
+    PASSWORD_MAX_PENDING = 10 ** 6
+
+
+class PooledConfig(BenchConfig):
+    pass
+
+
+def percentile(samples, pct):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * pct / 100))] * 1000
+
+
+def run(config_class, logins, reads, server_threads, users, event_id):
+    from app import create_app, password_hasher
+    app = create_app(config_class)
+    app.test_client().get(f'/event/{event_id}')  # warm up templates
+
+    def login(i):
+        client = app.test_client()
+        return client.post('/login', data={'username': f'bench{i % users}',
+                                           'password': 'benchpass'}).status_code
+
+    def read(submitted):
+        app.test_client().get(f'/event/{event_id}')
+        return time.perf_counter() - submitted
+
+    login_futures, read_futures = [], []
+    with ThreadPoolExecutor(max_workers=server_threads) as server:
+        for i in range(max(logins, reads)):
+            if i < logins:
+                login_futures.append(server.submit(login, i))
+            if i < reads:
+                read_futures.append(server.submit(read, time.perf_counter()))
+    latencies = [f.result() for f in read_futures]
+    statuses = Counter(f.result() for f in login_futures)
+    return latencies, statuses, password_hasher.stats()
+
+
+def upgraded_hashes(method):
+    conn = connect()
+    cursor = conn.cursor()
+    cursor.execute("SELECT COUNT(*) FROM users WHERE password_hash LIKE %s", (method + '$%',))
+    (count,) = cursor.fetchone()
+    cursor.close()
+    conn.close()
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--logins', type=int, default=400)
+    parser.add_argument('--reads', type=int, default=400)
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--server-threads', type=int, default=16)
+    parser.add_argument('--legacy-hashes', action='store_true',
+                        help='seed pbkdf2 hashes so logins upgrade them')
+    args = parser.parse_args()
+
+    print(f"{'scenario':<22} {'page p50':>9} {'page p99':>9} {'logins ok':>10} {'503':>5} {'upgraded':>9}")
+    for name, config_class, logins in [('no storm', PooledConfig, 0),
+                                       ('storm, inline', InlineConfig, args.logins),
+                                       ('storm, hashing pool', PooledConfig, args.logins)]:
+        reset_database()
+        seed(events=1, users=args.users)
+        if args.legacy_hashes:
+            conn = connect()
+            cursor = conn.cursor()
+            cursor.execute('UPDATE users SET password_hash = %s',
+                           (generate_password_hash('benchpass', method='pbkdf2:sha256:600000'),))
+            conn.commit()
+            cursor.close()
+            conn.close()
+
+        latencies, statuses, stats = run(config_class, logins, args.reads,
+                                         args.server_threads, args.users, 1)
+        upgraded = upgraded_hashes(config_class.PASSWORD_HASH_METHOD) if args.legacy_hashes else '-'
+        print(f"{name:<22} {percentile(latencies, 50):>7.1f}ms {percentile(latencies, 99):>7.1f}ms "
+              f"{statuses.get(302, 0):>10} {statuses.get(503, 0):>5} {upgraded:>9}")
+        print(f"{'':<22} hashing (cumulative): {stats}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+"""Requests/sec with and without connection pooling.
+
+Drives main.index from a thread pool against two apps: one with the default
+pool and one with MYSQL_POOL_SIZE = 0 (a new connection per request, which is
+what Flask-MySQLdb did).
+
+    python -m benchmarks.bench_pool --requests 2000 --threads 16
+"""
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.common import BenchConfig, reset_database, seed
+
+
+class UnpooledConfig(BenchConfig):
+    MYSQL_POOL_SIZE = 0
+
+
+def run(config_class, total, threads):
+    from app import create_app
+    app = create_app(config_class)
+    client = app.test_client()
+    client.get('/')  # warm up templates
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(lambda _: client.get('/').status_code, range(total)))
+    elapsed = time.perf_counter() - start
+
+    with app.app_context():
+        from app import mysql
+        stats = mysql.pool.stats()
+    return total / elapsed, stats
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--threads', type=int, default=16)
+    args = parser.parse_args()
+
+    reset_database()
+    seed(events=30, users=50, registrations_per_event=10)
+
+    for label, config_class in (('unpooled', UnpooledConfig), ('pooled', BenchConfig)):
+        rps, stats = run(config_class, args.requests, args.threads)
+        print(f"{label:>9}: {rps:8.1f} req/s  created={stats['created']} "
+              f"checkouts={stats['checkouts']} wait_max={stats['wait_time_max'] * 1000:.1f}ms "
+              f"timeouts={stats['timeouts']}")
+
+
+if __name__ == '__main__':
+    main()
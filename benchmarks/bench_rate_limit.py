@@ -0,0 +1,168 @@
+"""Rate limits and load shedding under concurrent clients.
+
+Forks --workers processes, each running its own copy of the app as a
+gunicorn worker would, all sharing one RATE_LIMIT_FILE, and drives each
+scenario from --threads client threads per process, each client with its
+own REMOTE_ADDR:
+
+    login flood      one username from many addresses, wrong password
+    login drained    the same again once that username's bucket is empty
+    address flood    many usernames from one address
+    registration     many users registering for one event at once
+    retry storm      one user resubmitting the same registration
+
+For each scenario it reports how many requests were admitted and how many
+got 429. It also checks that the admitted total across all processes stays
+within the rule's burst plus what refilled during the run; buckets kept per
+process would admit up to --workers times that. It checks that every 429
+carried a Retry-After header, and that the drained run took no database
+connection at all.
+
+    python -m benchmarks.bench_rate_limit --workers 4 --threads 16
+"""
+import argparse
+import multiprocessing
+import os
+import tempfile
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.common import BenchConfig, connect, login_as, reset_database, seed
+
+RULES = {
+    'login_username': (5, 60),
+    'login_ip': (20, 60),
+    'register_user': (3, 60),
+    'register_ip': (10 ** 6, 60),
+    'register_event': (50, 5),
+}
+
+
+class RateLimitConfig(BenchConfig):
+    RATE_LIMIT_ENABLED = True
+    RATE_LIMIT_FILE = os.path.join(tempfile.gettempdir(), f'bench-ratelimit-{os.getpid()}.bin')
+    RATE_LIMITS = RULES
+    RATE_LIMIT_MAX_CONCURRENT = 4
+    PASSWORD_WORKERS = 0
+
+
+def send(app, request):
+    method, path, form, address, user_id = request
+    client = app.test_client()
+    if user_id is not None:
+        login_as(client, user_id)
+    response = client.open(path, method=method, data=form, environ_base={'REMOTE_ADDR': address})
+    return response.status_code, response.headers.get('Retry-After')
+
+
+def worker(requests, threads, results):
+    # One "gunicorn worker": its own app, limiter and connection pool
+    from app import create_app
+    app = create_app(RateLimitConfig)
+    checkouts = app.extensions['mysql_pool'].stats()['checkouts']
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        responses = list(pool.map(lambda request: send(app, request), requests))
+    statuses = Counter(status for status, _ in responses)
+    missing_retry_after = sum(1 for status, retry_after in responses if status == 429 and not retry_after)
+    stats = app.extensions['rate_limiter'].stats()
+    results.put((os.getpid(), statuses, missing_retry_after,
+                 app.extensions['mysql_pool'].stats()['checkouts'] - checkouts, stats['shed']))
+
+
+def run(requests, workers, threads):
+    context = multiprocessing.get_context('fork')
+    results = context.Queue()
+    processes = [context.Process(target=worker, args=(requests[i::workers], threads, results))
+                 for i in range(workers)]
+    start = time.perf_counter()
+    for process in processes:
+        process.start()
+    collected = [results.get() for _ in processes]
+    elapsed = time.perf_counter() - start
+    for process in processes:
+        process.join()
+
+    statuses = Counter()
+    for _, counts, _, _, _ in collected:
+        statuses.update(counts)
+    return {
+        'elapsed': elapsed,
+        'statuses': statuses,
+        'admitted': sum(count for status, count in statuses.items() if status != 429),
+        'rejected': statuses.get(429, 0),
+        'missing_retry_after': sum(item[2] for item in collected),
+        'checkouts': sum(item[3] for item in collected),
+        'shed': sum(item[4] for item in collected),
+        'processes': len({item[0] for item in collected}),
+    }
+
+
+def allowance(rule, elapsed):
+    burst, period = RULES[rule]
+    return burst + int(burst / period * elapsed) + 1
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--requests', type=int, default=400, help='requests per scenario')
+    args = parser.parse_args()
+
+    reset_database()
+    seed(events=1, users=args.requests, capacity=args.requests)
+    conn = connect()
+    cursor = conn.cursor()
+    cursor.execute('SELECT id FROM users ORDER BY id')
+    user_ids = [row[0] for row in cursor.fetchall()]
+    cursor.execute('SELECT id FROM events')
+    (event_id,) = cursor.fetchone()
+    cursor.close()
+    conn.close()
+    if os.path.exists(RateLimitConfig.RATE_LIMIT_FILE):
+        os.unlink(RateLimitConfig.RATE_LIMIT_FILE)
+
+    n = args.requests
+    login = '/login'
+    register = f'/event/{event_id}/register'
+    wrong = {'username': 'bench0', 'password': 'wrong'}
+    scenarios = [
+        ('login flood', 'login_username',
+         [('POST', login, wrong, f'10.1.{i // 250}.{i % 250}', None) for i in range(n)]),
+        ('login drained', None,
+         [('POST', login, wrong, f'10.2.{i // 250}.{i % 250}', None) for i in range(n)]),
+        ('address flood', 'login_ip',
+         [('POST', login, {'username': f'nobody{i}', 'password': 'x'}, '10.3.0.1', None)
+          for i in range(n)]),
+        ('registration', 'register_event',
+         [('POST', register, {}, f'10.4.{i // 250}.{i % 250}', user_ids[i]) for i in range(n)]),
+        ('retry storm', 'register_user',
+         [('POST', register, {}, '10.5.0.1', user_ids[-1]) for _ in range(n)]),
+    ]
+
+    failures = []
+    print(f"{'scenario':<15} {'admitted':>8} {'bound':>6} {'429':>5} {'shed':>5} "
+          f"{'db checkouts':>12} {'time':>7}")
+    for name, rule, requests in scenarios:
+        result = run(requests, args.workers, args.threads)
+        bound = allowance(rule, result['elapsed']) if rule else 0
+        print(f"{name:<15} {result['admitted']:>8} {bound:>6} {result['rejected']:>5} "
+              f"{result['shed']:>5} {result['checkouts']:>12} {result['elapsed']:>6.2f}s")
+        if result['admitted'] > bound:
+            failures.append(f'{name}: admitted {result["admitted"]}, more than {bound}')
+        if result['missing_retry_after']:
+            failures.append(f'{name}: {result["missing_retry_after"]} 429s without Retry-After')
+        if rule is None and result['checkouts']:
+            failures.append(f'{name}: rejected requests took {result["checkouts"]} connections')
+        if result['processes'] != args.workers:
+            failures.append(f'{name}: only {result["processes"]} of {args.workers} workers reported')
+
+    os.unlink(RateLimitConfig.RATE_LIMIT_FILE)
+    if failures:
+        raise SystemExit('FAILED:\n  ' + '\n  '.join(failures))
+    print(f'OK: limits held across {args.workers} processes')
+
+
+if __name__ == '__main__':
+    main()
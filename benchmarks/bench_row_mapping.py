@@ -0,0 +1,84 @@
+"""Per-row cost of turning event rows into template-ready objects.
+
+Compares the old DATE_FORMAT + strptime round trip against the TIME
+converter plus EventRecord mapping on a synthetic 10k-row result set.
+Needs no database.
+
+    python -m benchmarks.bench_row_mapping
+"""
+import sys
+import time
+import tracemalloc
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from records import EventRecord, parse_time
+
+ROWS = 10_000
+REPEAT = 5
+
+
+def make_rows():
+    base = date(2025, 1, 1)
+    rows = []
+    for i in range(ROWS):
+        day = base + timedelta(days=i % 365)
+        rows.append({
+            'id': i, 'title': f'Event {i}', 'description': 'x' * 80, 'date': day,
+            'time': '15:30:00', 'location': 'Main hall', 'capacity': 200,
+            'registered_count': i % 200, 'image_url': None, 'status': 'published',
+            'created_by': 1, 'created_at': datetime(2025, 1, 1, 12, 0, 0),
+            'formatted_date': day.isoformat(), 'formatted_time': '15:30:00',
+        })
+    return rows
+
+
+def legacy(rows):
+    # What the routes did before: strings from DATE_FORMAT parsed back per row
+    for event in rows:
+        event = dict(event)
+        event['date'] = datetime.strptime(event['formatted_date'], '%Y-%m-%d')
+        event['time'] = datetime.strptime(event['formatted_time'], '%H:%M:%S')
+    return rows
+
+
+def mapped(rows):
+    # The TIME converter runs in the driver; records are built from typed values
+    out = []
+    for row in rows:
+        row = dict(row)
+        row['time'] = parse_time(row['time'])
+        out.append(row)
+    return EventRecord.from_rows(out)
+
+
+def measure(fn, rows):
+    best = float('inf')
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        fn(rows)
+        best = min(best, time.perf_counter() - start)
+    return best / len(rows) * 1e6
+
+
+def memory(fn, rows):
+    tracemalloc.start()
+    result = fn(rows)
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del result
+    return size / len(rows)
+
+
+def main():
+    rows = make_rows()
+    print(f"{ROWS} rows, best of {REPEAT}")
+    print(f"legacy strptime: {measure(legacy, rows):6.2f} us/row")
+    print(f"typed records:   {measure(mapped, rows):6.2f} us/row, "
+          f"{memory(mapped, rows):.0f} bytes/row retained")
+
+
+if __name__ == '__main__':
+    main()
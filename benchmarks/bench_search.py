@@ -0,0 +1,95 @@
+"""Search latency at 100k events.
+
+Seeds events with titles/descriptions drawn from a small vocabulary, then
+times search_events() (FULLTEXT, ranked, first page and a deep page),
+suggest_titles() for autocomplete prefixes and, for comparison, the
+LIKE '%term%' scan a search without the index would need.
+
+    python -m benchmarks.bench_search --events 100000
+"""
+import argparse
+import random
+
+import MySQLdb.cursors
+
+from benchmarks.common import connect, reset_database, seed, timed
+from search import search_events, suggest_titles
+
+WORDS = ('robotics', 'hackathon', 'music', 'dance', 'debate', 'quiz', 'football',
+         'cricket', 'workshop', 'seminar', 'python', 'startup', 'career', 'photography',
+         'drama', 'poetry', 'chess', 'marathon', 'yoga', 'astronomy', 'chemistry',
+         'film', 'festival', 'alumni', 'blood', 'donation', 'coding', 'design')
+PLACES = ('Main hall', 'Auditorium', 'Library', 'Sports ground', 'Lab block', 'Cafeteria')
+
+QUERIES = ['robotics', 'music festival', 'python workshop auditorium', 'chess']
+PREFIXES = ['ro', 'hack', 'photo', 'music fe']
+
+
+def seed_text(conn, events, batch=5000):
+    rng = random.Random(42)
+    cursor = conn.cursor()
+    for start in range(0, events, batch):
+        rows = []
+        for i in range(start, min(start + batch, events)):
+            title = ' '.join(rng.sample(WORDS, 3)).title()
+            description = ' '.join(rng.choice(WORDS) for _ in range(30))
+            rows.append((title, description, 1 + i % 60, rng.choice(PLACES)))
+        cursor.executemany('''
+            INSERT INTO events (title, description, date, time, location, capacity, status, created_by)
+            VALUES (%s, %s, DATE_ADD(CURDATE(), INTERVAL %s DAY), '10:00:00', %s, 100, 'published', 1)
+        ''', rows)
+        conn.commit()
+    cursor.execute('ANALYZE TABLE events')
+    cursor.fetchall()
+    cursor.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--events', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+
+    reset_database()
+    seed(events=0, users=1)
+    conn = connect()
+    seed_text(conn, args.events)
+    cursor = conn.cursor(MySQLdb.cursors.DictCursor)
+
+    def like_scan(text):
+        pattern = f'%{text}%'
+        cursor.execute('''
+            SELECT * FROM events
+            WHERE (title LIKE %s OR description LIKE %s OR location LIKE %s)
+            AND status = 'published' AND date >= CURDATE()
+            ORDER BY date ASC LIMIT 20
+        ''', (pattern, pattern, pattern))
+        cursor.fetchall()
+
+    def deep_page(text, pages=5):
+        page = search_events(cursor, text, per_page=20)
+        for _ in range(pages - 1):
+            if not page.next_cursor:
+                break
+            page = search_events(cursor, text, per_page=20, after=page.next_cursor)
+
+    print(f"{args.events} events")
+    print(f"{'query':<30} {'search p50':>11} {'p95':>9} {'5 pages p50':>12} {'LIKE p50':>10}")
+    for text in QUERIES:
+        first = timed(lambda: search_events(cursor, text, per_page=20), args.repeat)
+        deep = timed(lambda: deep_page(text), max(1, args.repeat // 5))
+        like = timed(lambda: like_scan(text.split()[0]), max(1, args.repeat // 5))
+        print(f"{text:<30} {first['p50_ms']:>9.2f}ms {first['p95_ms']:>7.2f}ms "
+              f"{deep['p50_ms']:>10.2f}ms {like['p50_ms']:>8.2f}ms")
+
+    print(f"\n{'prefix':<30} {'suggest p50':>11} {'p95':>9}")
+    for text in PREFIXES:
+        suggest = timed(lambda: suggest_titles(cursor, text), args.repeat)
+        print(f"{text:<30} {suggest['p50_ms']:>9.2f}ms {suggest['p95_ms']:>7.2f}ms")
+
+    cursor.close()
+    conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,173 @@
+"""Live seat streams under a simulated crowd.
+
+Starts gunicorn with gevent workers and opens --subscribers SSE
+connections to /event/<id>/seats/stream from a single selector-driven
+thread, so the test needs no thread per client either.
+Then it posts --registrations registrations through the server and
+measures how long each one takes to reach every subscriber of its event.
+It also reports how many updates were sent per registration, which stays
+below 1 because bursts are coalesced. At the end it checks that every
+subscriber ended on the count in the database.
+
+    python -m benchmarks.bench_seat_stream --subscribers 5000 --registrations 300
+
+Needs gevent (pip install gevent) and a raised open-files limit for large
+crowds.
+"""
+import argparse
+import http.client
+import json
+import re
+import resource
+import selectors
+import socket
+import threading
+import time
+from collections import defaultdict
+
+from benchmarks.common import connect, reset_database, seed
+from benchmarks.loadtest import session_cookies, start_gunicorn
+
+DATA_RE = re.compile(rb'data: (\{[^\n]*\})\n')
+
+
+class Crowd:
+    """Subscribers multiplexed over one selector; records (time, seats) per update."""
+
+    def __init__(self, port, event_ids, count):
+        self.selector = selectors.DefaultSelector()
+        self.updates = defaultdict(list)  # subscriber index -> [(time, seats)]
+        self.event_of = {}
+        self.buffers = {}
+        self.closed = 0
+        self._stop = False
+        for i in range(count):
+            event_id = event_ids[i % len(event_ids)]
+            sock = socket.create_connection(('127.0.0.1', port))
+            sock.sendall(f'GET /event/{event_id}/seats/stream HTTP/1.1\r\n'
+                         f'Host: 127.0.0.1\r\nAccept: text/event-stream\r\n\r\n'.encode())
+            sock.setblocking(False)
+            self.selector.register(sock, selectors.EVENT_READ, i)
+            self.event_of[i] = event_id
+            self.buffers[i] = b''
+
+    def run(self):
+        while not self._stop:
+            for key, _ in self.selector.select(timeout=0.1):
+                i = key.data
+                try:
+                    chunk = key.fileobj.recv(65536)
+                except BlockingIOError:
+                    continue
+                if not chunk:
+                    self.selector.unregister(key.fileobj)
+                    key.fileobj.close()
+                    self.closed += 1
+                    continue
+                now = time.perf_counter()
+                buffer = self.buffers[i] + chunk
+                end = 0
+                for match in DATA_RE.finditer(buffer):
+                    self.updates[i].append((now, json.loads(match.group(1))['seats']))
+                    end = match.end()
+                self.buffers[i] = buffer[end:][-4096:]
+
+    def stop(self):
+        self._stop = True
+
+    def close(self):
+        for key in list(self.selector.get_map().values()):
+            key.fileobj.close()
+
+
+def percentile(samples, pct):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * pct / 100))] * 1000 if samples else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--subscribers', type=int, default=2000)
+    parser.add_argument('--events', type=int, default=5)
+    parser.add_argument('--registrations', type=int, default=200)
+    parser.add_argument('--workers', type=int, default=2, help='gunicorn gevent workers')
+    parser.add_argument('--port', type=int, default=8766)
+    args = parser.parse_args()
+    args.threads = 1  # gevent workers ignore --threads
+
+    _, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+    reset_database()
+    seed(events=args.events, users=args.registrations, capacity=args.registrations * 2)
+    conn = connect()
+    cursor = conn.cursor()
+    cursor.execute('SELECT id FROM users ORDER BY id')
+    user_ids = [row[0] for row in cursor.fetchall()]
+    cursor.execute('SELECT id, capacity FROM events ORDER BY id')
+    capacities = dict(cursor.fetchall())
+    cursor.close()
+    conn.close()
+    event_ids = list(capacities)
+    cookies = session_cookies(user_ids)
+
+    server = start_gunicorn(args, worker_class='gevent',
+                            extra=('--worker-connections', str(args.subscribers + 100)))
+    try:
+        crowd = Crowd(args.port, event_ids, args.subscribers)
+        reader = threading.Thread(target=crowd.run, daemon=True)
+        reader.start()
+        # Wait until every subscriber has its initial count
+        deadline = time.monotonic() + 60
+        while len(crowd.updates) < args.subscribers and time.monotonic() < deadline:
+            time.sleep(0.1)
+        print(f'{len(crowd.updates)}/{args.subscribers} subscribers connected')
+
+        # Registration k on an event leaves capacity - k seats; record when it committed
+        committed = defaultdict(list)  # event id -> [(time, seats after)]
+        taken = defaultdict(int)
+        client = http.client.HTTPConnection('127.0.0.1', args.port, timeout=30)
+        start = time.perf_counter()
+        for i, user_id in enumerate(user_ids[:args.registrations]):
+            event_id = event_ids[i % len(event_ids)]
+            client.request('POST', f'/event/{event_id}/register', headers={'Cookie': cookies[user_id]})
+            client.getresponse().read()
+            taken[event_id] += 1
+            committed[event_id].append((time.perf_counter(), capacities[event_id] - taken[event_id]))
+        elapsed = time.perf_counter() - start
+        client.close()
+        time.sleep(3)  # longer than the poll interval, so every update has landed
+        crowd.stop()
+        reader.join()
+        crowd.close()
+    finally:
+        server.terminate()
+        server.wait()
+
+    # Latency: from a registration's commit to the first update at or below its count
+    latencies = []
+    sent = 0
+    correct = 0
+    for i, received in crowd.updates.items():
+        event_id = crowd.event_of[i]
+        sent += len(received) - 1  # the first one is the initial count
+        if received and received[-1][1] == capacities[event_id] - taken[event_id]:
+            correct += 1
+        for committed_at, seats in committed[event_id]:
+            arrival = next((t for t, value in received if value <= seats), None)
+            if arrival is not None:
+                latencies.append(arrival - committed_at)
+
+    print(f'{args.registrations} registrations in {elapsed:.2f}s, {args.subscribers} subscribers '
+          f'on {args.events} events, {args.workers} workers')
+    print(f'delivery latency p50 {percentile(latencies, 50):.1f}ms '
+          f'p99 {percentile(latencies, 99):.1f}ms')
+    print(f'updates per subscriber per registration: '
+          f'{sent / max(1, args.subscribers) / (args.registrations / args.events):.2f} (coalesced)')
+    print(f'{correct}/{len(crowd.updates)} subscribers ended on the database count, '
+          f'{crowd.closed} dropped early')
+    assert correct == len(crowd.updates), 'some subscribers missed the final count'
+
+
+if __name__ == '__main__':
+    main()
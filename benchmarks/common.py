@@ -0,0 +1,130 @@
+import os
+import sys
+import time
+from pathlib import Path
+
+import MySQLdb
+from werkzeug.security import generate_password_hash
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from config import Config
+from sqlscript import split_statements
+
+# Benchmarks never touch the real database; point them at a scratch one.
+BENCH_DB = os.environ.get('BENCH_MYSQL_DB', 'college_events_bench')
+
+# Duplicate column, duplicate key name, trigger already exists
+REAPPLIED_ERRORS = (1060, 1061, 1359)
+
+
+class BenchConfig(Config):
+    MYSQL_DB = BENCH_DB
+    TESTING = True
+    # Benchmarks send everything from one address; bench_rate_limit turns it on
+    RATE_LIMIT_ENABLED = False
+
+
+def connect(db=BENCH_DB, **overrides):
+    # overrides (host, port, user, passwd) point at another instance, e.g. a replica
+    kwargs = dict(host=Config.MYSQL_HOST, user=Config.MYSQL_USER,
+                  passwd=Config.MYSQL_PASSWORD, charset=Config.MYSQL_CHARSET)
+    kwargs.update(overrides)
+    if db:
+        kwargs['db'] = db
+    return MySQLdb.connect(**kwargs)
+
+
+def reset_database(**overrides):
+    # Recreate the scratch database from schema.sql and apply migrations
+    conn = connect(db=None, **overrides)
+    cursor = conn.cursor()
+    cursor.execute(f'DROP DATABASE IF EXISTS `{BENCH_DB}`')
+    cursor.execute(f'CREATE DATABASE `{BENCH_DB}` CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci')
+    cursor.execute(f'USE `{BENCH_DB}`')
+
+    scripts = [ROOT / 'schema.sql'] + sorted((ROOT / 'migrations').glob('*.sql'))
+    for script in scripts:
+        for statement in split_statements(script.read_text()):
+            # The scripts target the real database by name; stay on the scratch one
+            words = statement.upper().split(None, 2)
+            if words[0] == 'USE' or words[:2] in (['CREATE', 'DATABASE'], ['CREATE', 'SCHEMA']):
+                continue
+            try:
+                cursor.execute(statement)
+            except MySQLdb.Error as e:
+                # schema.sql already has what the migrations add
+                if not e.args or e.args[0] not in REAPPLIED_ERRORS:
+                    raise
+    conn.commit()
+    cursor.close()
+    conn.close()
+
+
+def seed(events=10, users=100, registrations_per_event=0, capacity=None, **overrides):
+    conn = connect(**overrides)
+    cursor = conn.cursor()
+    password_hash = generate_password_hash('benchpass')
+
+    cursor.executemany(
+        'INSERT IGNORE INTO users (username, email, password_hash) VALUES (%s, %s, %s)',
+        [(f'bench{i}', f'bench{i}@example.com', password_hash) for i in range(users)]
+    )
+    cursor.executemany('''
+        INSERT INTO events (title, description, date, time, location, capacity, status, created_by)
+        VALUES (%s, %s, DATE_ADD(CURDATE(), INTERVAL %s DAY), '10:00:00', %s, %s, 'published', 1)
+    ''', [(f'Bench event {i}', 'Benchmark event', 1 + i % 60, 'Main hall',
+           capacity or max(users, 1)) for i in range(events)])
+    conn.commit()
+
+    if registrations_per_event:
+        add_registrations(conn, registrations_per_event)
+
+    cursor.close()
+    conn.close()
+
+
+def add_registrations(conn, per_event):
+    # Register the first `per_event` users for every event, keeping counters in sync
+    cursor = conn.cursor()
+    cursor.execute('''
+        INSERT IGNORE INTO event_registrations (event_id, user_id)
+        SELECT e.id, u.id
+        FROM events e
+        JOIN (SELECT id FROM users ORDER BY id LIMIT %s) u
+    ''', (per_event,))
+    cursor.execute('''
+        UPDATE events e
+        SET e.registered_count = (
+            SELECT COUNT(*) FROM event_registrations er WHERE er.event_id = e.id
+        )
+    ''')
+    conn.commit()
+    cursor.close()
+
+
+def create_bench_app():
+    from app import create_app
+    return create_app(BenchConfig)
+
+
+def login_as(client, user_id):
+    # Skip the password round trip; Flask-Login only needs the session key
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user_id)
+        session['_fresh'] = True
+
+
+def timed(fn, repeat=50):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    samples.sort()
+    return {
+        'p50_ms': samples[len(samples) // 2] * 1000,
+        'p95_ms': samples[int(len(samples) * 0.95) - 1] * 1000,
+        'mean_ms': sum(samples) / len(samples) * 1000,
+    }
@@ -0,0 +1,172 @@
+"""EXPLAIN regression check for the route queries.
+
+Seeds the scratch database and requests each route in ROUTES through the
+test client, with a connection wrapper built on metrics.InstrumentedCursor
+that records every SELECT the route runs together with its arguments. Then
+it runs EXPLAIN on each distinct statement and exits non-zero if any table
+is read with a full scan (type ALL) or the plan needs a filesort or
+temporary table, unless that is listed in ALLOWED with a reason.
+Paginated listings are requested a second time with the after= cursor from
+their first page, so their keyset queries are checked too.
+
+    python -m benchmarks.explain_queries
+"""
+import re
+import sys
+
+import MySQLdb.cursors
+
+from benchmarks.common import BenchConfig, add_registrations, connect, login_as, reset_database, seed
+from metrics import InstrumentedConnection, InstrumentedCursor, RequestStats
+
+AFTER_RE = re.compile(r'[?&](?:amp;)?after=([^&"\'\s\\]+)')
+
+# (route, method, path, user, form). Users are 'admin', 'student' (registered
+# for the full event), 'waiting' (on its waitlist) or None; {event} is the
+# full event's id.
+ROUTES = [
+    ('main.index', 'GET', '/', None, None),
+    ('main.event_details', 'GET', '/event/{event}', 'waiting', None),
+    ('main.search', 'GET', '/search?q=Bench', None, None),
+    ('main.my_requests', 'GET', '/my-requests', 'student', None),
+    ('main.my_registrations', 'GET', '/my-registrations', 'student', None),
+    ('admin.dashboard', 'GET', '/admin/dashboard', 'admin', None),
+    ('admin.manage_events', 'GET', '/admin/events', 'admin', None),
+    ('admin.event_requests', 'GET', '/admin/requests', 'admin', None),
+    ('admin.event_registrations', 'GET', '/admin/events/{event}/registrations', 'admin', None),
+    ('admin.export_event_registrations', 'GET',
+     '/admin/events/{event}/registrations/export?status=confirmed', 'admin', None),
+    ('api.events', 'GET', '/api/events?per_page=20', None, None),
+    ('api.events/ids', 'GET', '/api/events?ids=1,2,3', None, None),
+    ('auth.login', 'POST', '/login', None, {'username': 'bench1', 'password': 'benchpass'}),
+    # Frees a seat on the full event, so promote_waitlist runs
+    ('main.cancel_registration', 'POST', '/event/{event}/cancel', 'student', {}),
+]
+
+# Plans we accept on purpose, with the reason: (route, problem, table or
+# None for any table)
+ALLOWED = {
+    # Sorting one student's registrations by the joined event's date can't
+    # come from an index; the set is a handful of rows per user.
+    ('main.my_registrations', 'filesort', None),
+    ('main.my_registrations', 'temporary', None),
+    # One row per event date: the table is the precomputed summary
+    ('admin.dashboard', 'full scan', 'event_date_stats'),
+    # Relevance is computed per match, so ranking always sorts the matches
+    ('main.search', 'filesort', None),
+}
+
+
+class ExplainConfig(BenchConfig):
+    PASSWORD_WORKERS = 0
+
+
+class Recorder(RequestStats):
+    __slots__ = ('route', 'captured')
+
+    def __init__(self):
+        super().__init__()
+        self.route = None
+        self.captured = {}  # sql -> (route that ran it first, its arguments)
+
+
+class RecordingCursor(InstrumentedCursor):
+    __slots__ = ()
+
+    def execute(self, query, args=None):
+        if query.lstrip().upper().startswith(('SELECT', 'WITH')):
+            self._stats.captured.setdefault(query, (self._stats.route, args))
+        return super().execute(query, args)
+
+
+class RecordingConnection(InstrumentedConnection):
+    __slots__ = ()
+
+    def cursor(self, *args):
+        return RecordingCursor(self._conn.cursor(*args), self._stats)
+
+
+def capture(users, event_id):
+    """Runs ROUTES and returns [(route, sql, args)], one per distinct statement."""
+    from app import create_app
+    app = create_app(ExplainConfig)
+    recorder = Recorder()
+    app.extensions['mysql_connection_wrapper'] = lambda conn: RecordingConnection(conn, recorder)
+
+    for route, method, path, user, form in ROUTES:
+        recorder.route = route
+        path = path.format(event=event_id)
+        client = app.test_client()
+        if user:
+            login_as(client, users[user])
+        response = client.open(path, method=method, data=form)
+        if response.status_code >= 400:
+            raise SystemExit(f'{route}: {method} {path} answered {response.status_code}')
+        match = AFTER_RE.search(response.get_data(as_text=True))
+        if match:
+            client.get(path + ('&' if '?' in path else '?') + f'after={match.group(1)}')
+    return [(route, sql, args) for sql, (route, args) in recorder.captured.items()]
+
+
+def problems(route, plan):
+    found = []
+    for row in plan:
+        extra = row.get('Extra') or ''
+        if row.get('type') == 'ALL':
+            found.append(('full scan', row['table'], f"full scan of {row['table']}"))
+        if 'Using filesort' in extra:
+            found.append(('filesort', row['table'], f"filesort on {row['table']}"))
+        if 'Using temporary' in extra:
+            found.append(('temporary', row['table'], f"temporary table for {row['table']}"))
+    return [message for kind, table, message in found
+            if (route, kind, None) not in ALLOWED and (route, kind, table) not in ALLOWED]
+
+
+def main():
+    reset_database()
+    # Enough rows that the optimizer prefers indexes over scanning
+    seed(events=2000, users=2000)
+    conn = connect()
+    add_registrations(conn, 20)
+    cursor = conn.cursor(MySQLdb.cursors.DictCursor)
+    cursor.execute("UPDATE users SET role = 'admin' WHERE username = 'bench0'")
+    cursor.execute('''
+        INSERT INTO event_requests
+        (title, description, proposed_date, proposed_time, location, capacity, requested_by)
+        SELECT CONCAT('Request ', id), 'seeded', CURDATE(), '10:00:00', 'Hall', 50, id
+        FROM users
+    ''')
+    # One full event with a waitlist: the next 20 users wait for the first 20's seats
+    cursor.execute('SELECT MIN(id) AS id FROM events')
+    event_id = cursor.fetchone()['id']
+    cursor.execute('UPDATE events SET capacity = registered_count WHERE id = %s', (event_id,))
+    cursor.execute('''
+        INSERT INTO event_waitlist (event_id, user_id)
+        SELECT %s, id FROM users ORDER BY id LIMIT 20 OFFSET 20
+    ''', (event_id,))
+    cursor.execute("SELECT id, username FROM users WHERE username IN ('bench0', 'bench1', 'bench20')")
+    ids = {row['username']: row['id'] for row in cursor.fetchall()}
+    users = {'admin': ids['bench0'], 'student': ids['bench1'], 'waiting': ids['bench20']}
+    conn.commit()
+    for table in ('users', 'events', 'event_registrations', 'event_requests', 'event_waitlist'):
+        cursor.execute(f'ANALYZE TABLE {table}')
+        cursor.fetchall()
+
+    queries = capture(users, event_id)
+    failures = 0
+    for route, sql, params in queries:
+        cursor.execute('EXPLAIN ' + sql, params)
+        issues = problems(route, cursor.fetchall())
+        status = 'FAIL' if issues else 'ok'
+        statement = ' '.join(sql.split())[:80]
+        print(f"{status:>4}  {route}: {statement}" + (f"  ({'; '.join(issues)})" if issues else ''))
+        failures += bool(issues)
+
+    cursor.close()
+    conn.close()
+    print(f"{len(queries) - failures}/{len(queries)} query plans clean")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,254 @@
+"""Load test of the hot routes through gunicorn, with a regression baseline.
+
+Seeds the scratch database, starts gunicorn on benchmarks.wsgi:app and drives
+each scenario at a fixed concurrency for a fixed number of requests. It
+reports throughput, p50/p95/p99 latency and SQL queries per request (read
+from the Server-Timing header), writes JSON, and compares it against a saved
+baseline, exiting 1 if any scenario regressed beyond --tolerance.
+
+    python -m benchmarks.loadtest --save-baseline benchmarks/baseline.json
+    python -m benchmarks.loadtest --baseline benchmarks/baseline.json --output run.json
+
+The baseline is machine-specific: save it on the box that runs the check.
+"""
+import argparse
+import http.client
+import json
+import random
+import re
+import subprocess
+import sys
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode
+
+from benchmarks.common import ROOT, connect, create_bench_app, reset_database, seed
+
+SQL_TIMING_RE = re.compile(r'sql;dur=([\d.]+);desc="(\d+) queries"')
+
+
+def percentile(samples, pct):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * pct / 100))] * 1000 if samples else 0.0
+
+
+def prepare_data(args):
+    reset_database()
+    seed(events=args.events, users=args.users, registrations_per_event=args.registrations,
+         capacity=args.capacity)
+    conn = connect()
+    cursor = conn.cursor()
+    cursor.execute("UPDATE users SET role = 'admin' WHERE username = 'bench0'")
+    cursor.execute('''
+        INSERT INTO event_requests
+        (title, description, proposed_date, proposed_time, location, capacity, requested_by)
+        SELECT CONCAT('Request ', id), 'seeded', CURDATE(), '10:00:00', 'Hall', 50, id
+        FROM users LIMIT %s
+    ''', (args.requests_pending,))
+    cursor.execute("SELECT id FROM users WHERE username = 'bench0'")
+    (admin_id,) = cursor.fetchone()
+    cursor.execute('SELECT id FROM users ORDER BY id')
+    user_ids = [row[0] for row in cursor.fetchall()]
+    cursor.execute('SELECT id FROM events ORDER BY id')
+    event_ids = [row[0] for row in cursor.fetchall()]
+    conn.commit()
+    cursor.close()
+    conn.close()
+    return admin_id, user_ids, event_ids
+
+
+def session_cookies(user_ids):
+    # Signed Flask session cookies, so scenarios can act as any user without
+    # paying for a password check each time
+    app = create_bench_app()
+    serializer = app.session_interface.get_signing_serializer(app)
+    name = app.config['SESSION_COOKIE_NAME']
+    return {user_id: f"{name}={serializer.dumps({'_user_id': str(user_id), '_fresh': True})}"
+            for user_id in user_ids}
+
+
+def build_scenarios(admin_id, user_ids, event_ids, cookies):
+    # name -> function(i) returning (method, path, body, cookie)
+    students = [user_id for user_id in user_ids if user_id != admin_id]
+    admin = cookies[admin_id]
+    # Each register request uses a distinct (event, user) pair so it does real work
+    pairs = [(event_id, user_id) for user_id in students for event_id in event_ids]
+    random.Random(7).shuffle(pairs)
+    form = {'Content-Type': 'application/x-www-form-urlencoded'}
+
+    def register(i):
+        event_id, user_id = pairs[i % len(pairs)]
+        return 'POST', f'/event/{event_id}/register', None, cookies[user_id], {}
+
+    def login(i):
+        body = urlencode({'username': f'bench{i % len(user_ids)}', 'password': 'benchpass'})
+        return 'POST', '/login', body, None, form
+
+    return {
+        'main.index': lambda i: ('GET', '/', None, None, {}),
+        'main.event_details': lambda i: ('GET', f'/event/{event_ids[i % len(event_ids)]}', None,
+                                         cookies[students[i % len(students)]], {}),
+        'main.register_event': register,
+        'auth.login': login,
+        'admin.manage_events': lambda i: ('GET', '/admin/events', None, admin, {}),
+        'admin.event_requests': lambda i: ('GET', '/admin/requests', None, admin, {}),
+        'admin.event_registrations': lambda i: (
+            'GET', f'/admin/events/{event_ids[i % len(event_ids)]}/registrations', None, admin, {}),
+    }
+
+
+def run_scenario(port, make_request, total, concurrency):
+    local = threading.local()
+    counter = iter(range(total))
+    counter_lock = threading.Lock()
+    latencies, queries, sql_ms, statuses = [], [], [], Counter()
+    results_lock = threading.Lock()
+
+    def worker():
+        local.conn = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+        while True:
+            with counter_lock:
+                i = next(counter, None)
+            if i is None:
+                break
+            method, path, body, cookie, headers = make_request(i)
+            headers = dict(headers)
+            if cookie:
+                headers['Cookie'] = cookie
+            start = time.perf_counter()
+            try:
+                local.conn.request(method, path, body=body, headers=headers)
+                response = local.conn.getresponse()
+                response.read()
+                status = response.status
+                timing = SQL_TIMING_RE.search(response.getheader('Server-Timing') or '')
+            except (OSError, http.client.HTTPException):
+                local.conn.close()
+                local.conn = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+                status, timing = 'error', None
+            elapsed = time.perf_counter() - start
+            with results_lock:
+                latencies.append(elapsed)
+                statuses[status] += 1
+                if timing:
+                    sql_ms.append(float(timing.group(1)))
+                    queries.append(int(timing.group(2)))
+        local.conn.close()
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for _ in range(concurrency):
+            pool.submit(worker)
+    wall = time.perf_counter() - start
+
+    return {
+        'requests': total,
+        'concurrency': concurrency,
+        'throughput_rps': round(total / wall, 1),
+        'p50_ms': round(percentile(latencies, 50), 2),
+        'p95_ms': round(percentile(latencies, 95), 2),
+        'p99_ms': round(percentile(latencies, 99), 2),
+        'queries_per_request': round(sum(queries) / len(queries), 2) if queries else None,
+        'sql_ms_per_request': round(sum(sql_ms) / len(sql_ms), 2) if sql_ms else None,
+        'statuses': {str(status): count for status, count in sorted(statuses.items(), key=str)},
+    }
+
+
+def start_gunicorn(args, worker_class='gthread', extra=()):
+    command = [sys.executable, '-m', 'gunicorn', 'benchmarks.wsgi:app',
+               '--bind', f'127.0.0.1:{args.port}', '--workers', str(args.workers),
+               '--worker-class', worker_class, '--threads', str(args.threads),
+               '--log-level', 'warning', *extra]
+    server = subprocess.Popen(command, cwd=ROOT)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', args.port, timeout=1)
+            conn.request('GET', '/')
+            conn.getresponse().read()
+            conn.close()
+            return server
+        except OSError:
+            if server.poll() is not None:
+                raise SystemExit('gunicorn exited during startup')
+            time.sleep(0.2)
+    server.terminate()
+    raise SystemExit('gunicorn did not start within 30s')
+
+
+def compare(results, baseline, tolerance):
+    # A scenario regresses if it got slower, lost throughput or runs more queries
+    regressions = []
+    for name, current in results['scenarios'].items():
+        before = baseline.get('scenarios', {}).get(name)
+        if not before:
+            continue
+        if current['p95_ms'] > before['p95_ms'] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {before['p95_ms']}ms -> {current['p95_ms']}ms")
+        if current['throughput_rps'] < before['throughput_rps'] * (1 - tolerance):
+            regressions.append(f"{name}: throughput {before['throughput_rps']} -> {current['throughput_rps']} req/s")
+        if current['queries_per_request'] and before.get('queries_per_request') \
+                and current['queries_per_request'] > before['queries_per_request'] + 0.5:
+            regressions.append(f"{name}: queries/request {before['queries_per_request']} -> "
+                               f"{current['queries_per_request']}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test the hot routes through gunicorn')
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--events', type=int, default=200)
+    parser.add_argument('--registrations', type=int, default=50, help='seeded per event')
+    parser.add_argument('--capacity', type=int, default=500)
+    parser.add_argument('--requests-pending', type=int, default=500, help='seeded event requests')
+    parser.add_argument('--requests', type=int, default=2000, help='requests per scenario')
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--workers', type=int, default=4, help='gunicorn workers')
+    parser.add_argument('--threads', type=int, default=8, help='threads per gunicorn worker')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--scenario', action='append', help='run only these scenarios (repeatable)')
+    parser.add_argument('--output', help='write the results JSON here')
+    parser.add_argument('--baseline', help='compare against this results JSON')
+    parser.add_argument('--save-baseline', help='write the results as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed relative slowdown')
+    args = parser.parse_args()
+
+    admin_id, user_ids, event_ids = prepare_data(args)
+    scenarios = build_scenarios(admin_id, user_ids, event_ids, session_cookies(user_ids))
+    selected = args.scenario or list(scenarios)
+
+    server = start_gunicorn(args)
+    results = {
+        'config': {key: getattr(args, key) for key in
+                   ('users', 'events', 'registrations', 'requests', 'concurrency', 'workers', 'threads')},
+        'scenarios': {},
+    }
+    try:
+        print(f"{'scenario':<28} {'req/s':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'queries':>8}  statuses")
+        for name in selected:
+            result = run_scenario(args.port, scenarios[name], args.requests, args.concurrency)
+            results['scenarios'][name] = result
+            print(f"{name:<28} {result['throughput_rps']:>8} {result['p50_ms']:>6}ms {result['p95_ms']:>6}ms "
+                  f"{result['p99_ms']:>6}ms {result['queries_per_request'] or '-':>8}  {result['statuses']}")
+    finally:
+        server.terminate()
+        server.wait()
+
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, 'w') as f:
+                json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        print(f"{len(regressions)} regression(s) against {args.baseline}")
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+"""Registration rush stress test.
+
+Fires concurrent POSTs at main.register_event from many simulated users and
+checks that the event is never oversold and that the overflow lands on the
+waitlist. Then cancels a batch of registrations and checks FIFO promotion.
+
+    python -m benchmarks.stress_register --users 500 --capacity 100 --threads 64
+"""
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.common import connect, create_bench_app, login_as, reset_database, seed
+
+
+def fetch_state(event_id):
+    conn = connect()
+    cursor = conn.cursor()
+    cursor.execute('SELECT capacity, registered_count FROM events WHERE id = %s', (event_id,))
+    capacity, registered_count = cursor.fetchone()
+    cursor.execute('SELECT COUNT(*) FROM event_registrations WHERE event_id = %s', (event_id,))
+    (actual,) = cursor.fetchone()
+    cursor.execute('SELECT user_id FROM event_waitlist WHERE event_id = %s ORDER BY id', (event_id,))
+    waitlist = [row[0] for row in cursor.fetchall()]
+    cursor.close()
+    conn.close()
+    return capacity, registered_count, actual, waitlist
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=500)
+    parser.add_argument('--capacity', type=int, default=100)
+    parser.add_argument('--threads', type=int, default=64)
+    parser.add_argument('--cancel', type=int, default=20)
+    args = parser.parse_args()
+
+    reset_database()
+    seed(events=1, users=args.users, capacity=args.capacity)
+    app = create_bench_app()
+
+    conn = connect()
+    cursor = conn.cursor()
+    cursor.execute("SELECT id FROM users WHERE username LIKE 'bench%%' ORDER BY id")
+    user_ids = [row[0] for row in cursor.fetchall()]
+    cursor.execute('SELECT id FROM events LIMIT 1')
+    (event_id,) = cursor.fetchone()
+    cursor.close()
+    conn.close()
+
+    def register(user_id):
+        client = app.test_client()
+        login_as(client, user_id)
+        return client.post(f'/event/{event_id}/register').status_code
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.threads) as pool:
+        statuses = list(pool.map(register, user_ids))
+    elapsed = time.perf_counter() - start
+
+    capacity, registered_count, actual, waitlist = fetch_state(event_id)
+    print(f"{len(statuses)} registration attempts in {elapsed:.2f}s "
+          f"({len(statuses) / elapsed:.0f} req/s, {args.threads} threads)")
+    print(f"capacity={capacity} registered_count={registered_count} "
+          f"rows={actual} waitlisted={len(waitlist)}")
+
+    assert registered_count == actual, 'counter drifted from event_registrations'
+    assert actual <= capacity, 'event oversold'
+    assert actual == min(capacity, len(user_ids)), 'seats left unsold'
+    assert actual + len(waitlist) == len(user_ids), 'attempts lost'
+
+    # Cancel some registrations and check the waitlist head gets promoted
+    conn = connect()
+    cursor = conn.cursor()
+    cursor.execute('SELECT user_id FROM event_registrations WHERE event_id = %s LIMIT %s',
+                   (event_id, args.cancel))
+    cancelling = [row[0] for row in cursor.fetchall()]
+    cursor.close()
+    conn.close()
+
+    expected_promoted = waitlist[:len(cancelling)]
+
+    def cancel(user_id):
+        client = app.test_client()
+        login_as(client, user_id)
+        return client.post(f'/event/{event_id}/cancel').status_code
+
+    with ThreadPoolExecutor(max_workers=args.threads) as pool:
+        list(pool.map(cancel, cancelling))
+
+    capacity, registered_count, actual, remaining = fetch_state(event_id)
+    print(f"after {len(cancelling)} cancellations: registered_count={registered_count} "
+          f"rows={actual} waitlisted={len(remaining)}")
+
+    assert registered_count == actual <= capacity
+    assert remaining == waitlist[len(expected_promoted):], 'waitlist not promoted in FIFO order'
+    print('OK: no overselling, FIFO promotion verified')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,7 @@
+# gunicorn entry point for the load test: the app against the scratch database
+#     gunicorn benchmarks.wsgi:app
+from benchmarks.common import create_bench_app
+from app import warm_up
+
+app = create_bench_app()
+warm_up(app)
@@ -0,0 +1,101 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+def touch_marker(path):
+    # Tell every worker process sharing this marker file to drop its cache
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, 'a'):
+        os.utime(path, None)
+
+
+class TTLCache:
+    """A thread-safe LRU cache whose entries also expire after ``ttl`` seconds.
+
+    If ``marker_path`` is set, the cache is cleared whenever that file's
+    mtime changes (checked at most once per ``marker_interval`` seconds), so
+    out-of-process tools such as create_admin.py can invalidate it.
+    """
+
+    def __init__(self, maxsize=1024, ttl=300, marker_path=None, marker_interval=1.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.marker_path = marker_path
+        self.marker_interval = marker_interval
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self._marker_mtime = self._read_marker()
+        self._marker_checked = time.monotonic()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def init_app(self, app, prefix):
+        self.maxsize = app.config.get(f'{prefix}_SIZE', self.maxsize)
+        self.ttl = app.config.get(f'{prefix}_TTL', self.ttl)
+        self.marker_path = app.config.get(f'{prefix}_MARKER', self.marker_path)
+        self._marker_mtime = self._read_marker()
+        self.clear()
+
+    def _read_marker(self):
+        if not self.marker_path:
+            return None
+        try:
+            return os.stat(self.marker_path).st_mtime
+        except OSError:
+            return None
+
+    def _check_marker(self, now):
+        if not self.marker_path or now - self._marker_checked < self.marker_interval:
+            return
+        self._marker_checked = now
+        mtime = self._read_marker()
+        if mtime != self._marker_mtime:
+            self._marker_mtime = mtime
+            self._data.clear()
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            self._check_marker(now)
+            entry = self._data.get(key)
+            if entry is None or entry[1] < now:
+                if entry is not None:
+                    del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + (self.ttl if ttl is None else ttl))
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._data),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+            }
@@ -1,12 +1,13 @@
 from flask import Flask
-from flask_mysqldb import MySQL
 from werkzeug.security import generate_password_hash
 import MySQLdb.cursors
 from config import Config
+from db import MySQLPool
+from cache import touch_marker
 
 app = Flask(__name__)
 app.config.from_object(Config)
-mysql = MySQL(app)
+mysql = MySQLPool(app)
 
 def create_admin_user():
     # Admin credentials
@@ -15,7 +16,7 @@ def create_admin_user():
     admin_email = 'admin@example.com'
     
     # Generate password hash
-    password_hash = generate_password_hash(admin_password)
+    password_hash = generate_password_hash(admin_password, method=Config.PASSWORD_HASH_METHOD)
     
     try:
         cursor = mysql.connection.cursor(MySQLdb.cursors.DictCursor)
@@ -43,6 +44,9 @@ def create_admin_user():
         mysql.connection.commit()
         cursor.close()
         
+        # Running workers may have the old role cached
+        touch_marker(Config.USER_CACHE_MARKER)
+        
     except Exception as e:
         print(f"Error creating admin user: {e}")
 
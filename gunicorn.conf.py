@@ -0,0 +1,54 @@
+"""gunicorn settings for production:
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+With preload_app the master imports the app, compiles its templates and
+builds its URL map once (app.warm_up), and then forks the workers, so a
+worker boots without importing or compiling anything and shares those
+pages of memory with the master. Everything tied to a process, such as
+database connections, the password hashing pool and the seat publisher
+thread, is created in each worker on first use; the master closes its
+connections before forking.
+
+Settings come from the environment. Set GUNICORN_WORKER_CLASS=gevent rather
+than passing -k gevent, so the app is loaded after monkey-patching. Only
+gevent workers open live seat streams from pages; run them as a separate
+deployment for the seats/stream URLs, with SEAT_STREAM_PAGES=1 on the
+threaded one.
+"""
+import os
+import time
+
+_loading_started = time.perf_counter()
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('WEB_CONCURRENCY', (os.cpu_count() or 1) * 2 + 1))
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+# Below MYSQL_POOL_SIZE, so request threads rarely wait for a connection
+threads = int(os.environ.get('GUNICORN_THREADS', 8))
+# gevent only: open connections per worker, above SEAT_STREAM_MAX_CLIENTS
+worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', 6000))
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1') == '1'
+timeout = 30
+graceful_timeout = 30
+keepalive = 5
+
+if worker_class == 'gevent' and preload_app:
+    # The app creates its locks while loading; they must be gevent's
+    from gevent import monkey
+    monkey.patch_all()
+
+
+def when_ready(server):
+    server.log.info('Master ready in %.1fms (preload_app=%s)',
+                    (time.perf_counter() - _loading_started) * 1000, preload_app)
+
+
+def post_fork(server, worker):
+    worker.forked_at = time.perf_counter()
+
+
+def post_worker_init(worker):
+    # Fork to ready to accept requests; without preload_app this includes loading the app
+    worker.log.info('Worker %s booted in %.1fms', worker.pid,
+                    (time.perf_counter() - worker.forked_at) * 1000)
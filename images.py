@@ -0,0 +1,215 @@
+import json
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app, url_for
+from PIL import Image, ImageOps, ImageSequence
+
+# Widths generated for each upload (never wider than the original)
+RENDITION_WIDTHS = (320, 640, 1280)
+RENDITION_DIR = 'renditions'
+FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+# Formats uploads may have, and how they are re-encoded without metadata
+CLEAN_FORMATS = {
+    'JPEG': {'quality': 95},
+    'PNG': {'optimize': True},
+    'GIF': {},
+}
+# Image info that affects how it renders; everything else is dropped
+KEEP_INFO = ('transparency', 'duration', 'loop', 'disposal', 'background')
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+_max_workers = 2
+_manifests = {}
+
+
+def init_images(app):
+    global _max_workers
+    _max_workers = app.config.get('IMAGE_WORKERS', _max_workers)
+    app.jinja_env.globals['image_srcset'] = image_srcset
+
+
+def _get_executor():
+    # One pool per process; a pool inherited through fork has no threads
+    global _executor, _executor_pid
+    with _executor_lock:
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = ThreadPoolExecutor(max_workers=_max_workers,
+                                           thread_name_prefix='image-worker')
+            _executor_pid = os.getpid()
+        return _executor
+
+
+def _rendition_dir(upload_dir):
+    return os.path.join(upload_dir, RENDITION_DIR)
+
+
+def _manifest_path(upload_dir, filename):
+    return os.path.join(_rendition_dir(upload_dir), os.path.splitext(filename)[0] + '.json')
+
+
+def rendition_name(filename, width, ext):
+    return f'{os.path.splitext(filename)[0]}_{width}w.{ext}'
+
+
+def _save_atomic(image, path, pil_format, options):
+    # Write next to the target and rename, so nobody sees a half-written file
+    tmp_path = path + '.tmp'
+    image.save(tmp_path, pil_format, **options)
+    os.replace(tmp_path, path)
+
+
+def check_image(path):
+    """Raise OSError unless path is a PNG, JPEG or GIF.
+
+    Only the header is read. Pillow raises Image.DecompressionBombError,
+    which is not an OSError, for an image with too many pixels.
+    """
+    with Image.open(path) as image:
+        if image.format not in CLEAN_FORMATS:
+            raise OSError(f'Unsupported image format: {image.format}')
+
+
+def strip_metadata(path, target):
+    """Write a copy of the image at path to target without its metadata.
+
+    Every format is re-encoded, dropping EXIF (camera, GPS, ...), PNG text
+    and eXIf chunks, comments and ICC profiles; EXIF orientation is applied
+    to the pixels first.
+    """
+    with Image.open(path) as original:
+        pil_format = original.format
+        if pil_format not in CLEAN_FORMATS:
+            raise OSError(f'Unsupported image format: {pil_format}')
+        frames = []
+        for frame in ImageSequence.Iterator(original):
+            frame = ImageOps.exif_transpose(frame)
+            frame.load()
+            frame.info = {key: value for key, value in frame.info.items() if key in KEEP_INFO}
+            frames.append(frame)
+    options = dict(CLEAN_FORMATS[pil_format])
+    if len(frames) > 1:
+        # Animated GIF/PNG
+        options.update(save_all=True, append_images=frames[1:])
+    _save_atomic(frames[0], target, pil_format, options)
+
+
+def publish_clean(upload_dir, temp_path, filename):
+    """Publish a staged upload under filename with its metadata stripped.
+
+    The staged file is removed either way. A file that is already published,
+    from an earlier upload of the same bytes, is never rewritten.
+    """
+    target = os.path.join(upload_dir, filename)
+    try:
+        if os.path.exists(target):
+            return
+        clean_path = temp_path + '.clean'
+        strip_metadata(temp_path, clean_path)
+        try:
+            # Unlike a rename, a link never replaces an existing file
+            os.link(clean_path, target)
+        except FileExistsError:
+            pass
+        finally:
+            os.unlink(clean_path)
+    finally:
+        os.unlink(temp_path)
+
+
+def process_upload(upload_dir, filename):
+    """Write the WebP/JPEG renditions of a published upload.
+
+    The manifest listing the generated widths is written last, so templates
+    only start using renditions once all of them exist.
+    """
+    source = os.path.join(upload_dir, filename)
+    os.makedirs(_rendition_dir(upload_dir), exist_ok=True)
+
+    with Image.open(source) as original:
+        image = ImageOps.exif_transpose(original)
+        image.load()
+
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if image.mode in ('LA', 'P') else 'RGB')
+    opaque = image.convert('RGB') if image.mode == 'RGBA' else image
+
+    widths = sorted({min(width, image.width) for width in RENDITION_WIDTHS})
+    for width in widths:
+        height = max(1, round(image.height * width / image.width))
+        for ext, (pil_format, options) in FORMATS.items():
+            frame = image if ext == 'webp' else opaque
+            resized = frame.resize((width, height), Image.LANCZOS) if width != image.width else frame
+            path = os.path.join(_rendition_dir(upload_dir), rendition_name(filename, width, ext))
+            _save_atomic(resized, path, pil_format, options)
+
+    manifest = _manifest_path(upload_dir, filename)
+    with open(manifest + '.tmp', 'w') as f:
+        json.dump({'widths': widths}, f)
+    os.replace(manifest + '.tmp', manifest)
+    return widths
+
+
+def _log_failure(future, filename):
+    error = future.exception()
+    if error is not None:
+        logger.error('Image processing failed for %s: %s', filename, error)
+
+
+def _publish(upload_dir, temp_path, filename):
+    publish_clean(upload_dir, temp_path, filename)
+    if not os.path.exists(_manifest_path(upload_dir, filename)):
+        process_upload(upload_dir, filename)
+
+
+def schedule_publish(upload_dir, temp_path, filename):
+    # Called once the staged upload's row is committed; the request doesn't wait
+    future = _get_executor().submit(_publish, upload_dir, temp_path, filename)
+    future.add_done_callback(lambda f: _log_failure(f, filename))
+    return future
+
+
+def forget(filename):
+    _manifests.pop(filename, None)
+
+
+def image_srcset(filename, ext):
+    """srcset for the renditions of an upload, or '' until they are ready."""
+    if not filename:
+        return ''
+    widths = _manifests.get(filename)
+    if widths is None:
+        upload_dir = os.path.join(current_app.root_path, current_app.config['UPLOAD_FOLDER'])
+        try:
+            with open(_manifest_path(upload_dir, filename)) as f:
+                widths = json.load(f)['widths']
+        except (OSError, ValueError, KeyError):
+            return ''
+        _manifests[filename] = widths
+    return ', '.join(
+        f"{url_for('static', filename=f'uploads/{RENDITION_DIR}/' + rendition_name(filename, width, ext))} {width}w"
+        for width in widths
+    )
+
+
+if __name__ == '__main__':
+    # Backfill renditions for uploads that predate the pipeline
+    from config import Config, BASE_DIR
+
+    upload_dir = os.path.join(BASE_DIR, Config.UPLOAD_FOLDER)
+    for name in sorted(os.listdir(upload_dir)):
+        if os.path.isfile(os.path.join(upload_dir, name)):
+            try:
+                print(f"{name}: {process_upload(upload_dir, name)}")
+            except OSError as e:
+                print(f"{name}: skipped ({e})")
@@ -0,0 +1,277 @@
+"""Bulk-import a student roster, optionally pre-registering cohorts for events.
+
+The roster is CSV (with a header) or JSONL, one user per row:
+
+    username,email,password,events
+    asha,asha@example.edu,s3cret,12;15
+
+``events`` is optional: event IDs separated by ';'. ``--event`` registers
+every imported user for an event as well. Rows are streamed in batches; the
+passwords of each batch are hashed across a process pool, and the batch
+is inserted and committed as a unit. Progress is checkpointed to
+<roster>.progress after every batch, so an interrupted import resumes where
+it stopped. Duplicates and invalid rows are reported and skipped.
+
+    python import_users.py students.csv --event 12 --workers 8
+"""
+import argparse
+import csv
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from itertools import islice
+
+from flask import Flask
+from werkzeug.security import generate_password_hash
+import MySQLdb.cursors
+from config import Config
+from db import MySQLPool
+from cache import touch_marker
+from stats import registrations_changed
+
+app = Flask(__name__)
+app.config.from_object(Config)
+mysql = MySQLPool(app)
+
+BATCH_SIZE = 1000
+
+
+def read_roster(path, fmt):
+    # Yields (line number, record dict) without loading the whole file
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        if fmt == 'csv':
+            reader = csv.DictReader(f)
+            for row in reader:
+                yield reader.line_num, row
+        else:
+            for line_num, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    yield line_num, json.loads(line)
+                except ValueError:
+                    yield line_num, None
+
+
+def parse_record(record):
+    # Returns (username, email, password, event ids) or a reason for skipping
+    if not isinstance(record, dict):
+        return 'unreadable row'
+    username = str(record.get('username') or '').strip()
+    email = str(record.get('email') or '').strip().lower()
+    password = str(record.get('password') or '')
+    if not username or len(username) > 50:
+        return 'missing or too long username'
+    if '@' not in email or len(email) > 120:
+        return 'invalid email'
+    if not password:
+        return 'missing password'
+
+    events = record.get('events') or []
+    if isinstance(events, str):
+        events = [value for value in events.split(';') if value.strip()]
+    try:
+        events = [int(value) for value in events]
+    except (TypeError, ValueError):
+        return 'invalid events list'
+    return username, email, password, events
+
+
+def load_checkpoint(path):
+    try:
+        with open(path) as f:
+            return json.load(f)['records']
+    except (OSError, ValueError, KeyError):
+        return 0
+
+
+def save_checkpoint(path, records):
+    with open(path + '.tmp', 'w') as f:
+        json.dump({'records': records}, f)
+    os.replace(path + '.tmp', path)
+
+
+def find_existing(cursor, usernames, emails):
+    # Quick pre-check so known users skip password hashing. The column
+    # collation also ignores accents, so this can miss duplicates; the
+    # INSERT IGNORE in import_batch is what actually decides.
+    placeholders = ', '.join(['%s'] * len(usernames))
+    cursor.execute(f'''
+        SELECT id, username, email FROM users
+        WHERE username IN ({placeholders}) OR email IN ({placeholders})
+    ''', list(usernames) + list(emails))
+    rows = cursor.fetchall()
+    return {row['username'].lower(): row['id'] for row in rows}, {row['email'].lower() for row in rows}
+
+
+def register_cohort(cursor, event_id, user_ids):
+    # Same rules as main.register_event: seats up to capacity, the rest are
+    # waitlisted in roster order. Runs inside the batch transaction.
+    cursor.execute('SELECT capacity, registered_count FROM events WHERE id = %s FOR UPDATE', (event_id,))
+    event = cursor.fetchone()
+    if not event:
+        return None
+
+    placeholders = ', '.join(['%s'] * len(user_ids))
+    cursor.execute(f'''
+        SELECT user_id FROM event_registrations WHERE event_id = %s AND user_id IN ({placeholders})
+    ''', [event_id] + user_ids)
+    already = {row['user_id'] for row in cursor.fetchall()}
+    user_ids = [user_id for user_id in dict.fromkeys(user_ids) if user_id not in already]
+
+    free = max(0, event['capacity'] - event['registered_count'])
+    seated, waiting = user_ids[:free], user_ids[free:]
+    if seated:
+        cursor.executemany('INSERT INTO event_registrations (event_id, user_id) VALUES (%s, %s)',
+                           [(event_id, user_id) for user_id in seated])
+        # A seat replaces any place they already held on the waitlist
+        cursor.execute(f'''
+            DELETE FROM event_waitlist WHERE event_id = %s AND user_id IN ({', '.join(['%s'] * len(seated))})
+        ''', [event_id] + seated)
+        cursor.execute('UPDATE events SET registered_count = registered_count + %s WHERE id = %s',
+                       (len(seated), event_id))
+        registrations_changed(cursor, event_id, registered=len(seated))
+    if waiting:
+        cursor.executemany('INSERT IGNORE INTO event_waitlist (event_id, user_id) VALUES (%s, %s)',
+                           [(event_id, user_id) for user_id in waiting])
+    return len(seated), len(waiting)
+
+
+def import_batch(cursor, batch, pool, workers, extra_events, totals):
+    rows = []
+    seen_usernames, seen_emails = set(), set()
+    for line_num, record in batch:
+        parsed = parse_record(record)
+        if isinstance(parsed, str):
+            print(f"line {line_num}: skipped, {parsed}")
+            totals['invalid'] += 1
+            continue
+        rows.append((line_num,) + parsed)
+    if not rows:
+        return
+
+    existing_usernames, existing_emails = find_existing(
+        cursor, [row[1] for row in rows], [row[2] for row in rows])
+    new_rows = []
+    accepted = []  # (username, existing user id or None, event ids), in roster order
+    for line_num, username, email, password, events in rows:
+        key = username.lower()
+        if key in existing_usernames or key in seen_usernames:
+            reason = f"duplicate username '{username}'"
+        elif email in existing_emails or email in seen_emails:
+            reason = f"duplicate email '{email}'"
+        else:
+            reason = None
+            seen_usernames.add(key)
+            seen_emails.add(email)
+            new_rows.append((line_num, username, email, password))
+        if reason:
+            print(f"line {line_num}: skipped, {reason}")
+            totals['duplicates'] += 1
+        # Existing users are still registered, so a re-run after a failed
+        # batch finishes the registrations
+        if reason is None or key in existing_usernames:
+            accepted.append((username, existing_usernames.get(key), list(events) + extra_events))
+
+    ids = {}  # username -> id of the users inserted by this batch
+    if new_rows:
+        # Hashing dominates the import; spread it over all cores
+        hashes = list(pool.map(partial(generate_password_hash, method=Config.PASSWORD_HASH_METHOD),
+                               [row[3] for row in new_rows],
+                               chunksize=max(1, len(new_rows) // (workers * 4))))
+        # IGNORE skips rows the unique keys reject under the column collation
+        # (e.g. 'josé' when 'jose' exists) instead of failing the batch
+        cursor.executemany('INSERT IGNORE INTO users (username, email, password_hash) VALUES (%s, %s, %s)',
+                           [(username, email, password_hash)
+                            for (_, username, email, _), password_hash in zip(new_rows, hashes)])
+        # A row was inserted if its exact username now carries the hash we
+        # just generated; the salt makes the hash unique to this insert
+        hash_of = {row[1]: password_hash for row, password_hash in zip(new_rows, hashes)}
+        cursor.execute('SELECT id, username, password_hash FROM users WHERE username IN (%s)'
+                       % ', '.join(['%s'] * len(new_rows)), [row[1] for row in new_rows])
+        ids = {row['username']: row['id'] for row in cursor.fetchall()
+               if hash_of.get(row['username']) == row['password_hash']}
+        for line_num, username, email, _ in new_rows:
+            if username not in ids:
+                print(f"line {line_num}: skipped, duplicate username '{username}' or email '{email}'")
+                totals['duplicates'] += 1
+        totals['imported'] += len(ids)
+
+    cohort = {}  # event id -> user ids, in roster order
+    for username, user_id, events in accepted:
+        user_id = user_id or ids.get(username)
+        if user_id is None:
+            continue
+        for event_id in events:
+            cohort.setdefault(event_id, []).append(user_id)
+    for event_id, user_ids in sorted(cohort.items()):
+        result = register_cohort(cursor, event_id, user_ids)
+        if result is None:
+            print(f"event {event_id}: not found, registrations skipped")
+            continue
+        totals['registered'] += result[0]
+        totals['waitlisted'] += result[1]
+
+
+def import_users(path, fmt, batch_size, workers, extra_events, restart=False):
+    checkpoint = path + '.progress'
+    done = 0 if restart else load_checkpoint(checkpoint)
+    if done:
+        print(f"Resuming after {done} record(s) (use --restart to start over)")
+
+    totals = dict(imported=0, duplicates=0, invalid=0, registered=0, waitlisted=0)
+    records = islice(read_roster(path, fmt), done, None)
+    start = time.perf_counter()
+    cursor = mysql.connection.cursor(MySQLdb.cursors.DictCursor)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        while True:
+            batch = list(islice(records, batch_size))
+            if not batch:
+                break
+            try:
+                import_batch(cursor, batch, pool, workers, extra_events, totals)
+                mysql.connection.commit()
+            except MySQLdb.Error as e:
+                mysql.connection.rollback()
+                cursor.close()
+                print(f"Error importing lines {batch[0][0]}-{batch[-1][0]}: {e}")
+                print(f"Committed {done} record(s); re-run the same command to resume.")
+                return False
+            done += len(batch)
+            save_checkpoint(checkpoint, done)
+            rate = totals['imported'] / max(time.perf_counter() - start, 1e-9)
+            print(f"{done} record(s) processed, {totals['imported']} imported, "
+                  f"{totals['duplicates']} duplicate(s), {totals['invalid']} invalid "
+                  f"({rate:.0f} users/s)")
+    cursor.close()
+
+    if os.path.exists(checkpoint):
+        os.unlink(checkpoint)
+    if totals['registered'] or totals['waitlisted']:
+        # Seat counts changed; make every worker drop its cached pages
+        touch_marker(Config.PAGE_CACHE_MARKER)
+    print(f"Done: {totals['imported']} imported, {totals['duplicates']} duplicate(s), "
+          f"{totals['invalid']} invalid, {totals['registered']} registration(s), "
+          f"{totals['waitlisted']} waitlisted.")
+    return True
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Bulk-import users from a CSV or JSONL roster')
+    parser.add_argument('roster', help='path to the .csv or .jsonl file')
+    parser.add_argument('--format', choices=['csv', 'jsonl'],
+                        help='input format (default: from the file extension)')
+    parser.add_argument('--event', type=int, action='append', default=[],
+                        help='also register every user for this event ID (repeatable)')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                        help='password hashing processes')
+    parser.add_argument('--restart', action='store_true', help='ignore the saved progress')
+    args = parser.parse_args()
+
+    fmt = args.format or ('jsonl' if args.roster.endswith(('.jsonl', '.ndjson')) else 'csv')
+    with app.app_context():
+        ok = import_users(args.roster, fmt, args.batch_size, args.workers, args.event, args.restart)
+    raise SystemExit(0 if ok else 1)
@@ -0,0 +1,381 @@
+import cProfile
+import hmac
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+
+from flask import Response, abort, g, request
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+WHITESPACE_RE = re.compile(r'\s+')
+LOOPBACK_ADDRS = ('127.0.0.1', '::1')
+
+_profile_lock = threading.Lock()  # cProfile can only run one profiler at a time
+
+
+class Registry:
+    """Counters and histograms for this process, keyed by name and labels."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = defaultdict(float)
+        self.histograms = {}
+
+    def inc(self, name, labels, value=1):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] += value
+
+    def observe(self, name, labels, value, buckets):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = [list(buckets), [0] * (len(buckets) + 1), 0.0, 0]
+            # Per-bucket counts; the last slot is +Inf. Made cumulative on render.
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    histogram[1][i] += 1
+                    break
+            else:
+                histogram[1][-1] += 1
+            histogram[2] += value
+            histogram[3] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'counters': [[name, list(labels), value] for (name, labels), value in self.counters.items()],
+                'histograms': [[name, list(labels), list(h[0]), list(h[1]), h[2], h[3]]
+                               for (name, labels), h in self.histograms.items()],
+            }
+
+
+registry = Registry()
+
+
+class RequestStats:
+    __slots__ = ('queries', 'sql_time', 'rows', 'statements')
+
+    def __init__(self):
+        self.queries = 0
+        self.sql_time = 0.0
+        self.rows = 0
+        self.statements = Counter()
+
+
+class InstrumentedCursor:
+    """Cursor proxy that counts queries, SQL time and rows for the request."""
+    __slots__ = ('_cursor', '_stats')
+
+    def __init__(self, cursor, stats):
+        self._cursor = cursor
+        self._stats = stats
+
+    def _timed(self, fn, *args):
+        start = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            self._stats.sql_time += time.perf_counter() - start
+
+    def _record(self, query):
+        self._stats.queries += 1
+        # Queries use placeholders, so the text identifies the statement
+        self._stats.statements[query] += 1
+
+    def execute(self, query, args=None):
+        self._record(query)
+        return self._timed(self._cursor.execute, query, args)
+
+    def executemany(self, query, args):
+        self._record(query)
+        return self._timed(self._cursor.executemany, query, args)
+
+    def fetchone(self):
+        row = self._timed(self._cursor.fetchone)
+        if row is not None:
+            self._stats.rows += 1
+        return row
+
+    def fetchmany(self, size=None):
+        rows = self._timed(self._cursor.fetchmany, *(() if size is None else (size,)))
+        self._stats.rows += len(rows)
+        return rows
+
+    def fetchall(self):
+        rows = self._timed(self._cursor.fetchall)
+        self._stats.rows += len(rows)
+        return rows
+
+    def __iter__(self):
+        return iter(self.fetchone, None)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self._cursor.close()
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class InstrumentedConnection:
+    __slots__ = ('_conn', '_stats')
+
+    def __init__(self, conn, stats):
+        self._conn = conn
+        self._stats = stats
+
+    def cursor(self, *args):
+        return InstrumentedCursor(self._conn.cursor(*args), self._stats)
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
+def wrap_connection(conn):
+    # Installed as the MySQLPool connection wrapper; only requests are measured
+    stats = g.get('_sql_stats')
+    return InstrumentedConnection(conn, stats) if stats is not None else conn
+
+
+def _format_value(value):
+    # Exact integers for counts; %g would round large counters
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in pairs) + '}'
+
+
+def _merge(snapshots):
+    counters = defaultdict(float)
+    histograms = {}
+    gauges = []
+    for snapshot in snapshots:
+        for name, labels, value in snapshot.get('counters', ()):
+            counters[(name, tuple(map(tuple, labels)))] += value
+        for name, labels, buckets, counts, total, count in snapshot.get('histograms', ()):
+            key = (name, tuple(map(tuple, labels)))
+            merged = histograms.get(key)
+            if merged is None or merged[0] != buckets:
+                histograms[key] = [buckets, list(counts), total, count]
+            else:
+                merged[1] = [a + b for a, b in zip(merged[1], counts)]
+                merged[2] += total
+                merged[3] += count
+        gauges.extend(snapshot.get('gauges', ()))
+    return counters, histograms, gauges
+
+
+def render(snapshots):
+    """Prometheus text exposition of the merged per-process snapshots."""
+    counters, histograms, gauges = _merge(snapshots)
+    lines = []
+    seen = set()
+
+    def header(name, kind):
+        if name not in seen:
+            seen.add(name)
+            lines.append(f'# TYPE {name} {kind}')
+
+    for (name, labels), value in sorted(counters.items()):
+        header(name, 'counter')
+        lines.append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+    for (name, labels), (buckets, counts, total, count) in sorted(histograms.items()):
+        header(name, 'histogram')
+        cumulative = 0
+        for bound, bucket_count in zip(list(buckets) + ['+Inf'], counts):
+            cumulative += bucket_count
+            lines.append(f'{name}_bucket{_format_labels(labels, [("le", bound)])} {cumulative}')
+        lines.append(f'{name}_sum{_format_labels(labels)} {_format_value(total)}')
+        lines.append(f'{name}_count{_format_labels(labels)} {count}')
+    for name, labels, value in sorted(gauges, key=lambda gauge: (gauge[0], gauge[1])):
+        header(name, 'gauge')
+        lines.append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+    return '\n'.join(lines) + '\n'
+
+
+class Metrics:
+    """Per-request latency and SQL instrumentation plus a /metrics endpoint.
+
+    Each worker process keeps its own Registry and periodically writes it to
+    METRICS_DIR/<pid>.json; /metrics merges every worker's file, so whichever
+    worker answers the scrape reports the totals.
+    """
+
+    def __init__(self):
+        self.gauges = {}
+        self._last_flush = 0.0
+        self._flush_lock = threading.Lock()
+
+    def init_app(self, app, gauges=None):
+        config = app.config
+        self.metrics_dir = config.get('METRICS_DIR')
+        self.flush_interval = config.get('METRICS_FLUSH_INTERVAL', 5)
+        self.stale_after = config.get('METRICS_STALE_AFTER', 600)
+        self.token = config.get('METRICS_TOKEN')
+        self.n_plus_one = config.get('N_PLUS_ONE_THRESHOLD', 5)
+        self.profile_rate = config.get('PROFILE_SAMPLE_RATE', 0)
+        self.profile_dir = config.get('PROFILE_DIR')
+        self.gauges.update(gauges or {})
+
+        app.extensions['metrics'] = self
+        app.extensions['mysql_connection_wrapper'] = wrap_connection
+        app.before_request(self._start)
+        app.after_request(self._record)
+        app.teardown_request(self._stop_profiler)
+        app.add_url_rule('/metrics', 'metrics', self.metrics_view)
+
+    def _start(self):
+        g._request_start = time.perf_counter()
+        g._sql_stats = RequestStats()
+        if self.profile_rate and random.random() < self.profile_rate \
+                and _profile_lock.acquire(blocking=False):
+            g._profiler = cProfile.Profile()
+            g._profiler.enable()
+
+    def _record(self, response):
+        start = g.pop('_request_start', None)
+        stats = g.pop('_sql_stats', None)
+        if start is None or stats is None:
+            return response
+        elapsed = time.perf_counter() - start
+        endpoint = request.endpoint or 'unmatched'
+        by_endpoint = {'endpoint': endpoint}
+
+        registry.observe('http_request_duration_seconds',
+                         {'endpoint': endpoint, 'method': request.method,
+                          'status': str(response.status_code)},
+                         elapsed, LATENCY_BUCKETS)
+        registry.observe('sql_queries_per_request', by_endpoint, stats.queries, QUERY_COUNT_BUCKETS)
+        registry.inc('sql_queries_total', by_endpoint, stats.queries)
+        registry.inc('sql_duration_seconds_total', by_endpoint, stats.sql_time)
+        registry.inc('sql_rows_fetched_total', by_endpoint, stats.rows)
+
+        # The same statement run again and again in one request is usually a
+        # query inside a loop
+        for statement, count in stats.statements.items():
+            if count >= self.n_plus_one:
+                registry.inc('sql_n_plus_one_total', by_endpoint)
+                logger.warning('Possible N+1 in %s: %d x %s', endpoint, count,
+                               WHITESPACE_RE.sub(' ', statement).strip()[:200])
+
+        response.headers['Server-Timing'] = (
+            f'app;dur={elapsed * 1000:.1f}, '
+            f'sql;dur={stats.sql_time * 1000:.1f};desc="{stats.queries} queries"'
+        )
+        self.maybe_flush()
+        return response
+
+    def _stop_profiler(self, exception):
+        profiler = g.pop('_profiler', None)
+        if profiler is None:
+            return
+        profiler.disable()
+        _profile_lock.release()
+        if self.profile_dir:
+            os.makedirs(self.profile_dir, exist_ok=True)
+            name = f"{time.strftime('%Y%m%d-%H%M%S')}-{request.endpoint or 'unmatched'}-{os.getpid()}.prof"
+            # Inspect with: python -m pstats <file>
+            profiler.dump_stats(os.path.join(self.profile_dir, name))
+
+    def _gauge_values(self):
+        pid = str(os.getpid())
+        values = []
+        for prefix, provider in self.gauges.items():
+            try:
+                stats = provider()
+            except Exception as e:
+                logger.warning('Gauge %s failed: %s', prefix, e)
+                continue
+            for key, value in stats.items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    values.append([f'{prefix}_{key}', [['pid', pid]], value])
+        return values
+
+    def snapshot(self):
+        snapshot = registry.snapshot()
+        snapshot['gauges'] = self._gauge_values()
+        return snapshot
+
+    def maybe_flush(self, force=False):
+        if not self.metrics_dir:
+            return
+        now = time.monotonic()
+        if not force and now - self._last_flush < self.flush_interval:
+            return
+        if not self._flush_lock.acquire(blocking=False):
+            return
+        try:
+            self._last_flush = now
+            os.makedirs(self.metrics_dir, exist_ok=True)
+            path = os.path.join(self.metrics_dir, f'{os.getpid()}.json')
+            with open(path + '.tmp', 'w') as f:
+                json.dump(self.snapshot(), f)
+            os.replace(path + '.tmp', path)
+        except OSError as e:
+            logger.warning('Could not write metrics snapshot: %s', e)
+        finally:
+            self._flush_lock.release()
+
+    def _collect(self):
+        if not self.metrics_dir:
+            return [self.snapshot()]
+        self.maybe_flush(force=True)
+        snapshots = []
+        for name in os.listdir(self.metrics_dir):
+            if not name.endswith('.json'):
+                continue
+            path = os.path.join(self.metrics_dir, name)
+            try:
+                if time.time() - os.path.getmtime(path) > self.stale_after \
+                        and not _pid_alive(int(name[:-5])):
+                    # Worker is gone; its totals drop out (Prometheus sees a reset)
+                    os.unlink(path)
+                    continue
+                with open(path) as f:
+                    snapshots.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+        return snapshots
+
+    def metrics_view(self):
+        # Closed by default: the token when one is configured, otherwise only
+        # direct requests from this host (a local reverse proxy adds
+        # X-Forwarded-For, so its traffic is turned away too)
+        if self.token:
+            if not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {self.token}'):
+                abort(403)
+        elif request.remote_addr not in LOOPBACK_ADDRS or 'X-Forwarded-For' in request.headers:
+            abort(403)
+        return Response(render(self._collect()), mimetype='text/plain; version=0.0.4')
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
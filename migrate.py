@@ -0,0 +1,67 @@
+import argparse
+from pathlib import Path
+from flask import Flask
+import MySQLdb
+import MySQLdb.cursors
+from config import Config
+from db import MySQLPool
+from sqlscript import split_statements
+
+MIGRATIONS_DIR = Path(__file__).resolve().parent / 'migrations'
+
+app = Flask(__name__)
+app.config.from_object(Config)
+mysql = MySQLPool(app)
+
+def statements(sql):
+    # The scripts name the database they target; we run against the configured one
+    for statement in split_statements(sql):
+        if not statement.upper().startswith('USE '):
+            yield statement
+
+def applied_versions(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version VARCHAR(255) PRIMARY KEY,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute('SELECT version FROM schema_migrations')
+    return {row['version'] for row in cursor.fetchall()}
+
+def migrate(mark_applied=False):
+    cursor = mysql.connection.cursor(MySQLdb.cursors.DictCursor)
+    done = applied_versions(cursor)
+    pending = [path for path in sorted(MIGRATIONS_DIR.glob('*.sql')) if path.stem not in done]
+
+    if not pending:
+        print("Database is up to date.")
+    for path in pending:
+        try:
+            if not mark_applied:
+                # MySQL commits DDL implicitly, so a failure can leave a
+                # migration half applied; fix it by hand and re-run
+                for statement in statements(path.read_text()):
+                    cursor.execute(statement)
+            cursor.execute('INSERT INTO schema_migrations (version) VALUES (%s)', (path.stem,))
+            mysql.connection.commit()
+            print(f"{'Marked' if mark_applied else 'Applied'} {path.stem}")
+        except MySQLdb.Error as e:
+            mysql.connection.rollback()
+            print(f"Error applying {path.stem}: {e}")
+            cursor.close()
+            return False
+
+    cursor.close()
+    return True
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Apply pending migrations from migrations/')
+    parser.add_argument('--mark-applied', action='store_true',
+                        help='record pending migrations without running them '
+                             '(for databases created from the current schema.sql)')
+    args = parser.parse_args()
+
+    with app.app_context():
+        ok = migrate(mark_applied=args.mark_applied)
+    raise SystemExit(0 if ok else 1)
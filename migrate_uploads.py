@@ -0,0 +1,110 @@
+import argparse
+import os
+from flask import Flask
+import MySQLdb.cursors
+from PIL import Image
+from config import Config, BASE_DIR
+from db import MySQLPool
+import images
+from uploads import delete_blob, discard_upload, is_content_addressed, stage_stream
+
+app = Flask(__name__)
+app.config.from_object(Config)
+mysql = MySQLPool(app)
+
+UPLOAD_DIR = os.path.join(BASE_DIR, Config.UPLOAD_FOLDER)
+
+def stage_copy(path):
+    # Staged like a new upload: a copy named after its bytes
+    with open(path, 'rb') as f:
+        return stage_stream(f, UPLOAD_DIR, path.rsplit('.', 1)[-1].lower())
+
+def migrate_uploads(dry_run=False):
+    cursor = mysql.connection.cursor(MySQLdb.cursors.DictCursor)
+    cursor.execute('''
+        SELECT DISTINCT image_url FROM (
+            SELECT image_url FROM events
+            UNION ALL
+            SELECT image_url FROM event_requests
+        ) refs
+        WHERE image_url IS NOT NULL
+    ''')
+    referenced = [row['image_url'] for row in cursor.fetchall()]
+
+    # Map every timestamp-named upload to its content-addressed name
+    staged = {}
+    for old_name in referenced:
+        if is_content_addressed(old_name):
+            continue
+        path = os.path.join(UPLOAD_DIR, old_name)
+        if not os.path.isfile(path):
+            print(f"Missing file for {old_name}, leaving it as is")
+            continue
+        try:
+            staged[old_name] = stage_copy(path)
+        except (OSError, Image.DecompressionBombError) as e:
+            print(f"Unreadable image {old_name} ({e}), leaving it as is")
+    renames = {old_name: upload.filename for old_name, upload in staged.items()}
+
+    for old_name, new_name in renames.items():
+        print(f"{old_name} -> {new_name}")
+    print(f"{len(renames)} file(s) to rename, {len(set(renames.values()))} unique blob(s)")
+    if dry_run:
+        for upload in staged.values():
+            discard_upload(upload)
+        cursor.close()
+        return True
+
+    try:
+        for old_name, new_name in renames.items():
+            # Strips the metadata; an existing blob is left as it is
+            images.publish_clean(UPLOAD_DIR, staged[old_name].temp_path, new_name)
+            cursor.execute('UPDATE events SET image_url = %s WHERE image_url = %s', (new_name, old_name))
+            cursor.execute('UPDATE event_requests SET image_url = %s WHERE image_url = %s',
+                           (new_name, old_name))
+
+        # Rebuild reference counts from scratch
+        cursor.execute('DELETE FROM upload_blobs')
+        cursor.execute('''
+            SELECT image_url, COUNT(*) as refs FROM (
+                SELECT image_url FROM events
+                UNION ALL
+                SELECT image_url FROM event_requests
+            ) refs
+            WHERE image_url IS NOT NULL
+            GROUP BY image_url
+        ''')
+        blobs = [row for row in cursor.fetchall() if is_content_addressed(row['image_url'])]
+        cursor.executemany('''
+            INSERT INTO upload_blobs (filename, size, ref_count) VALUES (%s, %s, %s)
+        ''', [(row['image_url'], os.path.getsize(os.path.join(UPLOAD_DIR, row['image_url'])),
+               row['refs']) for row in blobs])
+        mysql.connection.commit()
+    except Exception as e:
+        mysql.connection.rollback()
+        cursor.close()
+        for upload in staged.values():
+            discard_upload(upload)
+        print(f"Error migrating uploads: {e}")
+        return False
+    cursor.close()
+
+    # Only now that the rows point at the new names can the old files go
+    for old_name in renames:
+        delete_blob(UPLOAD_DIR, old_name)
+    for row in blobs:
+        manifest = os.path.join(UPLOAD_DIR, images.RENDITION_DIR,
+                                os.path.splitext(row['image_url'])[0] + '.json')
+        if not os.path.exists(manifest):
+            images.process_upload(UPLOAD_DIR, row['image_url'])
+    print(f"Migrated {len(renames)} file(s); {len(blobs)} blob(s) tracked.")
+    return True
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Move uploads to content-addressed names')
+    parser.add_argument('--dry-run', action='store_true', help='only print the planned renames')
+    args = parser.parse_args()
+
+    with app.app_context():
+        ok = migrate_uploads(dry_run=args.dry_run)
+    raise SystemExit(0 if ok else 1)
@@ -0,0 +1,11 @@
+-- Keep a running registration count on each event instead of
+-- aggregating event_registrations on every page view.
+USE college_events;
+
+ALTER TABLE events ADD COLUMN registered_count INT NOT NULL DEFAULT 0 AFTER capacity;
+
+-- Backfill from the existing registrations
+UPDATE events e
+SET e.registered_count = (
+    SELECT COUNT(*) FROM event_registrations er WHERE er.event_id = e.id
+);
@@ -0,0 +1,14 @@
+-- Waitlist for full events. Entries are promoted in FIFO (id) order
+-- when a registration is cancelled.
+USE college_events;
+
+CREATE TABLE IF NOT EXISTS event_waitlist (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    event_id INT NOT NULL,
+    user_id INT NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (event_id) REFERENCES events(id),
+    FOREIGN KEY (user_id) REFERENCES users(id),
+    UNIQUE KEY unique_waitlist (event_id, user_id),
+    KEY idx_waitlist_event_order (event_id, id)
+) CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci;
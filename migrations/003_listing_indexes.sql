@@ -0,0 +1,20 @@
+-- Indexes for the listing queries in main_routes.py and admin_routes.py.
+-- Checked by benchmarks/explain_queries.py.
+USE college_events;
+
+-- index, dashboard and event.events: published events by date/time
+ALTER TABLE events ADD INDEX idx_events_status_date_time (status, date, time);
+-- manage_events keyset pagination on (date, id), as InnoDB appends the PK
+ALTER TABLE events ADD INDEX idx_events_date (date);
+
+-- my_requests: a user's requests, newest first
+ALTER TABLE event_requests ADD INDEX idx_requests_requester_created (requested_by, created_at);
+-- admin event_requests keyset pagination on (created_at, id)
+ALTER TABLE event_requests ADD INDEX idx_requests_created (created_at);
+-- dashboard pending count
+ALTER TABLE event_requests ADD INDEX idx_requests_status (status);
+
+-- my_registrations: a user's registrations
+ALTER TABLE event_registrations ADD INDEX idx_registrations_user (user_id, event_id);
+-- admin event_registrations keyset pagination and export on (registration_date, id)
+ALTER TABLE event_registrations ADD INDEX idx_registrations_event_date (event_id, registration_date);
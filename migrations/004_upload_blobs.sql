@@ -0,0 +1,10 @@
+-- Reference counts for content-addressed uploads. Run migrate_uploads.py
+-- afterwards to rename existing files and fill this table.
+USE college_events;
+
+CREATE TABLE IF NOT EXISTS upload_blobs (
+    filename VARCHAR(255) PRIMARY KEY,
+    size INT NOT NULL DEFAULT 0,
+    ref_count INT NOT NULL DEFAULT 0,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+) CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci;
@@ -0,0 +1,6 @@
+-- Full-text index for main.search and main.search_suggest (search.py).
+-- InnoDB maintains it on every insert/update/delete of an event, so no
+-- separate reindexing step is needed.
+USE college_events;
+
+ALTER TABLE events ADD FULLTEXT INDEX ft_events_search (title, description, location);
@@ -0,0 +1,7 @@
+-- Link each approved event to the request it came from. The unique key
+-- means a request can only ever produce one event, however many times the
+-- review is submitted. Events created before this stay NULL.
+USE college_events;
+
+ALTER TABLE events ADD COLUMN source_request_id INT NULL AFTER created_at;
+ALTER TABLE events ADD UNIQUE KEY uq_events_source_request (source_request_id);
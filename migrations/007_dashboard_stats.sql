@@ -0,0 +1,38 @@
+-- Precomputed figures for admin.dashboard, maintained by stats.py.
+-- Backfilled here, and recount_registrations.py rebuilds them if they drift.
+USE college_events;
+
+CREATE TABLE IF NOT EXISTS event_date_stats (
+    date DATE PRIMARY KEY,
+    events INT NOT NULL DEFAULT 0,
+    capacity INT NOT NULL DEFAULT 0,
+    registered INT NOT NULL DEFAULT 0
+) CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci;
+
+CREATE TABLE IF NOT EXISTS registration_daily_stats (
+    day DATE NOT NULL,
+    event_id INT NOT NULL,
+    registrations INT NOT NULL DEFAULT 0,
+    cancellations INT NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, event_id)
+) CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci;
+
+CREATE TABLE IF NOT EXISTS stats_counters (
+    name VARCHAR(64) PRIMARY KEY,
+    value BIGINT NOT NULL DEFAULT 0
+) CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci;
+
+INSERT INTO event_date_stats (date, events, capacity, registered)
+SELECT date, COUNT(*), SUM(capacity), SUM(registered_count)
+FROM events
+WHERE status = 'published'
+GROUP BY date;
+
+-- Past cancellations weren't recorded, so history starts with registrations only
+INSERT INTO registration_daily_stats (day, event_id, registrations)
+SELECT DATE(registration_date), event_id, COUNT(*)
+FROM event_registrations
+GROUP BY DATE(registration_date), event_id;
+
+INSERT INTO stats_counters (name, value)
+SELECT 'pending_requests', COUNT(*) FROM event_requests WHERE status = 'pending';
@@ -0,0 +1,11 @@
+-- Per-event version for the JSON API's ETags (routes/api_routes.py). The
+-- trigger bumps it on every UPDATE, registrations and cancellations
+-- included, so no write path has to remember to.
+-- With binary logging on, creating the trigger needs SUPER (or
+-- log_bin_trust_function_creators = 1).
+USE college_events;
+
+ALTER TABLE events ADD COLUMN version INT UNSIGNED NOT NULL DEFAULT 1 AFTER registered_count;
+
+CREATE TRIGGER events_bump_version BEFORE UPDATE ON events
+FOR EACH ROW SET NEW.version = OLD.version + 1;
@@ -0,0 +1,20 @@
+-- Outgoing e-mails, queued by the routes in their own transaction and sent
+-- by notifications.py. Workers claim due rows with FOR UPDATE SKIP LOCKED.
+USE college_events;
+
+CREATE TABLE IF NOT EXISTS notification_jobs (
+    id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    kind VARCHAR(50) NOT NULL,
+    user_id INT NULL,
+    recipient VARCHAR(120) NOT NULL,
+    payload JSON NOT NULL,
+    status ENUM('pending', 'sent', 'failed') NOT NULL DEFAULT 'pending',
+    attempts INT NOT NULL DEFAULT 0,
+    run_after DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    last_error VARCHAR(500),
+    dedupe_key VARCHAR(100) NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    sent_at DATETIME NULL,
+    UNIQUE KEY uq_notification_dedupe (dedupe_key),
+    KEY idx_notification_due (status, run_after)
+) CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci;
@@ -0,0 +1,322 @@
+"""Notification e-mails, queued in MySQL and sent by a separate worker.
+
+Routes add rows to notification_jobs inside their own transaction, so a
+registration that rolls back never sends anything and nothing is lost if
+the mail server is down. The worker claims due jobs, sends one message per
+recipient for everything queued for them, and retries failures with
+exponential backoff. It also queues "event tomorrow" reminders.
+
+    python notifications.py           # run the worker
+    python notifications.py --once    # send what is due, then exit
+
+Several workers can run at once; each claims different jobs. For local
+testing, point MAIL_SERVER/MAIL_PORT at a debug SMTP server, for example
+``python -m aiosmtpd -n -l localhost:8025``.
+"""
+import argparse
+import json
+import logging
+import random
+import signal
+import smtplib
+import time
+from collections import defaultdict
+from email.message import EmailMessage
+from email.utils import formataddr, parseaddr
+
+import MySQLdb.cursors
+
+from db import PoolTimeout
+
+logger = logging.getLogger(__name__)
+
+# JSON payload for jobs about an event, built in SQL from the events row `e`
+EVENT_PAYLOAD = '''JSON_OBJECT('event_id', e.id, 'title', e.title,
+    'date', DATE_FORMAT(e.date, '%%W %%e %%M %%Y'), 'time', TIME_FORMAT(e.time, '%%H:%%i'),
+    'location', e.location)'''
+
+MESSAGES = {
+    'registration_confirmed': ('Registered: {title}',
+                               'You are registered for {title} on {date} at {time}, {location}.'),
+    'registration_cancelled': ('Cancelled: {title}',
+                               'Your registration for {title} on {date} has been cancelled.'),
+    'waitlist_promoted': ('You got a seat: {title}',
+                          'A seat opened up and you are now registered for {title} '
+                          'on {date} at {time}, {location}.'),
+    'request_approved': ('Event request approved: {title}',
+                         'Your request for {title} on {date} was approved and the event '
+                         'is now published.{remarks}'),
+    'request_rejected': ('Event request declined: {title}',
+                         'Your request for {title} on {date} was not approved.{remarks}'),
+    'event_reminder': ('Tomorrow: {title}',
+                       'A reminder that {title} is tomorrow, {date} at {time}, {location}.'),
+}
+
+
+def _in(values):
+    return ', '.join(['%s'] * len(values))
+
+
+def notify_users(cursor, kind, event_id, user_ids):
+    """Queue an event notification for each user, in the caller's transaction."""
+    if not user_ids:
+        return
+    cursor.execute(f'''
+        INSERT INTO notification_jobs (kind, user_id, recipient, payload)
+        SELECT %s, u.id, u.email, {EVENT_PAYLOAD}
+        FROM users u JOIN events e ON e.id = %s
+        WHERE u.id IN ({_in(user_ids)})
+    ''', [kind, event_id] + list(user_ids))
+
+
+def notify_reviewed(cursor, status, request_ids):
+    # status is 'approved' or 'rejected'; remarks are read back from the rows
+    if not request_ids:
+        return
+    cursor.execute(f'''
+        INSERT INTO notification_jobs (kind, user_id, recipient, payload)
+        SELECT %s, u.id, u.email,
+            JSON_OBJECT('title', r.title, 'date', DATE_FORMAT(r.proposed_date, '%%W %%e %%M %%Y'),
+                        'remarks', COALESCE(r.admin_remarks, ''))
+        FROM event_requests r JOIN users u ON u.id = r.requested_by
+        WHERE r.id IN ({_in(request_ids)})
+    ''', [f'request_{status}'] + list(request_ids))
+
+
+def schedule_reminders(cursor):
+    # One reminder per registration for tomorrow's events. The dedupe key
+    # includes the date, so a rescheduled event gets a fresh reminder.
+    cursor.execute(f'''
+        INSERT INTO notification_jobs (kind, user_id, recipient, payload, dedupe_key)
+        SELECT 'event_reminder', u.id, u.email, {EVENT_PAYLOAD},
+               CONCAT('reminder:', e.id, ':', u.id, ':', e.date)
+        FROM events e
+        JOIN event_registrations er ON er.event_id = e.id
+        JOIN users u ON u.id = er.user_id
+        WHERE e.status = 'published' AND e.date = CURDATE() + INTERVAL %s DAY
+        ON DUPLICATE KEY UPDATE id = id
+    ''', (1,))
+    return cursor.rowcount
+
+
+def render(kind, payload):
+    subject, body = MESSAGES[kind]
+    fields = dict(payload)
+    if 'remarks' in fields:
+        fields['remarks'] = f"\n\nRemarks: {fields['remarks']}" if fields['remarks'] else ''
+    return subject.format(**fields), body.format(**fields)
+
+
+def compose(config, recipient, jobs):
+    # Everything queued for one recipient goes out as a single message
+    parts = [render(job['kind'], json.loads(job['payload'])) for job in jobs]
+    message = EmailMessage()
+    message['From'] = formataddr(parseaddr(config['MAIL_SENDER']))
+    message['To'] = recipient
+    if len(parts) == 1:
+        message['Subject'] = parts[0][0]
+    else:
+        message['Subject'] = f'{len(parts)} updates from the College Event Portal'
+    body = '\n\n---\n\n'.join(body for _, body in parts)
+    message.set_content(f"Hello,\n\n{body}\n\n{config['PORTAL_URL']}\n")
+    return message
+
+
+def backoff(config, attempts):
+    # Exponential, capped, with jitter so failed batches don't retry in step
+    delay = min(config['NOTIFY_BACKOFF_BASE'] * 2 ** (attempts - 1), config['NOTIFY_BACKOFF_MAX'])
+    return int(delay * random.uniform(0.5, 1.0))
+
+
+class Worker:
+    def __init__(self, mysql, config):
+        self.mysql = mysql
+        self.config = config
+        self.running = True
+        self.sent = self.retried = self.failed = 0
+
+    def claim(self, cursor):
+        # SKIP LOCKED lets several workers claim side by side. Claimed jobs
+        # stay pending with run_after pushed out by the lease, so if this
+        # worker dies they come due again by themselves.
+        cursor.execute('''
+            SELECT id, kind, recipient, payload, attempts FROM notification_jobs
+            WHERE status = 'pending' AND run_after <= NOW()
+            ORDER BY run_after, id
+            LIMIT %s
+            FOR UPDATE SKIP LOCKED
+        ''', (self.config['NOTIFY_BATCH_SIZE'],))
+        jobs = cursor.fetchall()
+        if jobs:
+            cursor.execute(f'''
+                UPDATE notification_jobs
+                SET run_after = NOW() + INTERVAL %s SECOND, attempts = attempts + 1
+                WHERE id IN ({_in(jobs)})
+            ''', [self.config['NOTIFY_LEASE']] + [job['id'] for job in jobs])
+        self.mysql.connection.commit()
+        return jobs
+
+    def send(self, jobs):
+        """Returns (sent ids, [(job, error, permanent)])."""
+        by_recipient = defaultdict(list)
+        for job in jobs:
+            by_recipient[job['recipient']].append(job)
+
+        sent, failures = [], []
+        config = self.config
+        try:
+            smtp = smtplib.SMTP(config['MAIL_SERVER'], config['MAIL_PORT'], timeout=config['MAIL_TIMEOUT'])
+        except (smtplib.SMTPException, OSError) as e:
+            return [], [(job, f'connect: {e}', False) for job in jobs]
+        # A group leaves `pending` once it has been sent or has failed on its own
+        pending = list(by_recipient.items())
+        try:
+            if config['MAIL_USE_TLS']:
+                smtp.starttls()
+            if config['MAIL_USERNAME']:
+                smtp.login(config['MAIL_USERNAME'], config['MAIL_PASSWORD'])
+            while pending:
+                recipient, group = pending[-1]
+                try:
+                    smtp.send_message(compose(config, recipient, group))
+                    sent.extend(job['id'] for job in group)
+                except smtplib.SMTPRecipientsRefused as e:
+                    code = next(iter(e.recipients.values()))[0]
+                    failures.extend((job, f'refused: {code}', code >= 500) for job in group)
+                except smtplib.SMTPResponseException as e:
+                    # 5xx won't get better by retrying; 4xx might
+                    failures.extend((job, f'{e.smtp_code} {e.smtp_error!r}', e.smtp_code >= 500)
+                                    for job in group)
+                except (ValueError, KeyError, smtplib.SMTPNotSupportedError) as e:
+                    # A malformed address (e.g. with CR/LF) or payload can't be
+                    # sent however often it is retried
+                    failures.extend((job, f'invalid message: {e!r}', True) for job in group)
+                pending.pop()
+        except (smtplib.SMTPException, OSError) as e:
+            # Lost the connection: everything not sent yet is retried
+            failures.extend((job, str(e), False) for _, group in pending for job in group)
+        finally:
+            try:
+                smtp.quit()
+            except (smtplib.SMTPException, OSError):
+                smtp.close()
+        return sent, failures
+
+    def record(self, cursor, sent, failures):
+        if sent:
+            cursor.execute(f'''
+                UPDATE notification_jobs SET status = 'sent', sent_at = NOW(), last_error = NULL
+                WHERE id IN ({_in(sent)})
+            ''', sent)
+        retry, failed = [], []
+        for job, error, permanent in failures:
+            if permanent or job['attempts'] + 1 >= self.config['NOTIFY_MAX_ATTEMPTS']:
+                failed.append((error[:500], job['id']))
+            else:
+                retry.append((backoff(self.config, job['attempts'] + 1), error[:500], job['id']))
+        if retry:
+            cursor.executemany('''
+                UPDATE notification_jobs SET run_after = NOW() + INTERVAL %s SECOND, last_error = %s
+                WHERE id = %s
+            ''', retry)
+        if failed:
+            cursor.executemany('''
+                UPDATE notification_jobs SET status = 'failed', last_error = %s WHERE id = %s
+            ''', failed)
+        self.mysql.connection.commit()
+        for job, error, _ in failures:
+            logger.warning('Notification %s to %s failed (attempt %d): %s',
+                           job['id'], job['recipient'], job['attempts'] + 1, error)
+        self.sent += len(sent)
+        self.retried += len(retry)
+        self.failed += len(failed)
+
+    def run_once(self):
+        cursor = self.mysql.connection.cursor(MySQLdb.cursors.DictCursor)
+        try:
+            jobs = self.claim(cursor)
+            if not jobs:
+                return 0
+            # No transaction is open while talking to the mail server
+            sent, failures = self.send(jobs)
+            self.record(cursor, sent, failures)
+            return len(jobs)
+        finally:
+            cursor.close()
+
+    def housekeeping(self):
+        cursor = self.mysql.connection.cursor(MySQLdb.cursors.DictCursor)
+        queued = schedule_reminders(cursor)
+        cursor.execute('''
+            DELETE FROM notification_jobs
+            WHERE status = 'sent' AND sent_at < NOW() - INTERVAL %s DAY
+        ''', (self.config['NOTIFY_KEEP_DAYS'],))
+        self.mysql.connection.commit()
+        cursor.close()
+        if queued:
+            logger.info('Queued %d reminders for tomorrow', queued)
+
+    def sleep(self, seconds):
+        # In short steps, so SIGTERM doesn't wait out a long backoff
+        deadline = time.monotonic() + seconds
+        while self.running and time.monotonic() < deadline:
+            time.sleep(min(1, deadline - time.monotonic()))
+
+    def run(self, once=False):
+        last_housekeeping = None
+        errors = 0
+        while self.running:
+            try:
+                now = time.monotonic()
+                if last_housekeeping is None or now - last_housekeeping > self.config['NOTIFY_REMINDER_INTERVAL']:
+                    self.housekeeping()
+                    last_housekeeping = now
+                handled = self.run_once()
+            except (MySQLdb.Error, PoolTimeout, smtplib.SMTPException, OSError) as e:
+                # Database or mail server trouble: drop the connection if it
+                # was lost, and back off before trying the round again.
+                # Claimed jobs come due again once their lease runs out.
+                self.mysql.teardown(e)
+                if once:
+                    raise
+                errors += 1
+                delay = min(self.config['NOTIFY_POLL_INTERVAL'] * 2 ** (errors - 1),
+                            self.config['NOTIFY_BACKOFF_BASE'])
+                logger.warning('Notification round failed, retrying in %ds: %s', delay, e)
+                self.sleep(delay)
+                continue
+            errors = 0
+            if once and not handled:
+                break
+            if handled < self.config['NOTIFY_BATCH_SIZE'] and not once:
+                # Don't hold a pooled connection while idle
+                self.mysql.release()
+                self.sleep(self.config['NOTIFY_POLL_INTERVAL'])
+        self.mysql.release()
+        logger.info('Notifications sent=%d retried=%d failed=%d', self.sent, self.retried, self.failed)
+
+if __name__ == '__main__':
+    from flask import Flask
+    from config import Config
+    from db import MySQLPool
+
+    parser = argparse.ArgumentParser(description='Send queued notification e-mails')
+    parser.add_argument('--once', action='store_true', help='send what is due, then exit')
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    app.config.from_object(Config)
+    mysql = MySQLPool(app)
+    logging.basicConfig(level=app.config['LOG_LEVEL'],
+                        format='%(asctime)s %(levelname)s [%(process)d] %(name)s: %(message)s')
+
+    with app.app_context():
+        worker = Worker(mysql, app.config)
+
+        def stop(signum, frame):
+            # Finish the batch in hand, then exit
+            worker.running = False
+
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+        worker.run(once=args.once)
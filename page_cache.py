@@ -0,0 +1,105 @@
+import re
+from functools import wraps
+
+import MySQLdb.cursors
+from flask import current_app, make_response, request, session
+from flask_login import current_user
+
+from cache import TTLCache, touch_marker
+
+# Rendered anonymous pages, cleared whenever an event is created, edited or deleted
+page_cache = TTLCache(maxsize=256, ttl=60)
+# Seats left per event id; registrations only touch this, so pages stay cached
+seat_cache = TTLCache(maxsize=4096, ttl=5)
+
+# Templates wrap seat counts in these markers so cached pages can be refreshed
+SEATS_RE = re.compile(r'<!--seats:(\d+)-->-?\d*<!--/seats-->')
+
+
+def init_page_cache(app):
+    page_cache.init_app(app, 'PAGE_CACHE')
+    seat_cache.init_app(app, 'SEAT_CACHE')
+
+
+def invalidate_pages():
+    page_cache.clear()
+    if page_cache.marker_path:
+        touch_marker(page_cache.marker_path)
+
+
+def invalidate_seats(event_id):
+    seat_cache.invalidate(int(event_id))
+
+
+def seats_left(event_ids):
+    seats = {}
+    missing = []
+    for event_id in event_ids:
+        value = seat_cache.get(event_id)
+        if value is None:
+            missing.append(event_id)
+        else:
+            seats[event_id] = value
+
+    if missing:
+        mysql = current_app.extensions['mysql']
+        cursor = mysql.connection.cursor(MySQLdb.cursors.DictCursor)
+        cursor.execute(
+            'SELECT id, capacity - registered_count AS seats FROM events WHERE id IN (%s)'
+            % ', '.join(['%s'] * len(missing)),
+            missing
+        )
+        for row in cursor.fetchall():
+            seats[row['id']] = row['seats']
+            seat_cache.set(row['id'], row['seats'])
+        cursor.close()
+    return seats
+
+
+def fill_seats(body):
+    # Swap the seat counts baked into a cached page for current ones
+    event_ids = {int(event_id) for event_id in SEATS_RE.findall(body)}
+    if not event_ids:
+        return body
+    seats = seats_left(event_ids)
+
+    def replace(match):
+        event_id = int(match.group(1))
+        return f'<!--seats:{event_id}-->{seats.get(event_id, 0)}<!--/seats-->'
+
+    return SEATS_RE.sub(replace, body)
+
+
+def cached_page(view):
+    """Serve a public page from page_cache for anonymous visitors.
+
+    Logged-in users see their name in the navbar and anyone with pending
+    flash messages gets a one-off page, so both bypass the cache. Cached
+    responses carry an ETag, taken after the current seat counts are filled
+    in, and answer conditional GETs with 304. There is no Last-Modified:
+    the seat counts change without the cached page being rebuilt.
+    """
+    @wraps(view)
+    def decorated_function(*args, **kwargs):
+        if current_user.is_authenticated or '_flashes' in session:
+            return view(*args, **kwargs)
+
+        key = ('anonymous', request.full_path)
+        body = page_cache.get(key)
+        if body is None:
+            body = view(*args, **kwargs)
+            # A replica may not have the write that just cleared the cache
+            # yet, so a page read from one is only kept for as long as a
+            # replica is allowed to lag
+            ttl = None
+            if current_app.extensions['mysql'].used_replica():
+                ttl = current_app.config.get('MYSQL_REPLICA_MAX_LAG', 5)
+            page_cache.set(key, body, ttl=ttl)
+
+        response = make_response(fill_seats(body))
+        response.add_etag()
+        response.cache_control.public = True
+        response.cache_control.no_cache = True
+        response.vary.add('Cookie')
+        return response.make_conditional(request)
+    return decorated_function
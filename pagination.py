@@ -0,0 +1,140 @@
+import base64
+import json
+from datetime import date, datetime, time
+
+import MySQLdb.cursors
+
+DEFAULT_PER_PAGE = 50
+MAX_PER_PAGE = 200
+
+
+def encode_cursor(values):
+    values = [v.isoformat(' ') if isinstance(v, datetime)
+              else v.isoformat() if isinstance(v, (date, time)) else v
+              for v in values]
+    raw = json.dumps(values, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    # Returns None for anything malformed so callers fall back to the first page
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        values = json.loads(raw)
+    except (ValueError, TypeError):
+        return None
+    return values if isinstance(values, list) else None
+
+
+def per_page_arg(args, default=DEFAULT_PER_PAGE):
+    try:
+        return max(1, min(int(args.get('per_page', default)), MAX_PER_PAGE))
+    except (TypeError, ValueError):
+        return default
+
+
+def parse_ids(raw):
+    # '3,1,3' -> [3, 1]; None if anything isn't an integer
+    try:
+        return list(dict.fromkeys(int(part) for part in raw.split(',') if part.strip()))
+    except ValueError:
+        return None
+
+
+class Page:
+    __slots__ = ('items', 'next_cursor', 'prev_cursor')
+
+    def __init__(self, items, next_cursor=None, prev_cursor=None):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+
+def _seek_condition(columns, descending, forward):
+    # (a, b) < (x, y) written out as a < x OR (a = x AND b < y), which MySQL
+    # turns into an index range scan
+    op = '<' if descending == forward else '>'
+    clauses = []
+    for i, column in enumerate(columns):
+        parts = [f'{prev} = %s' for prev in columns[:i]] + [f'{column} {op} %s']
+        clauses.append('(' + ' AND '.join(parts) + ')')
+    return '(' + ' OR '.join(clauses) + ')'
+
+
+def _seek_params(values):
+    params = []
+    for i in range(len(values)):
+        params.extend(values[:i + 1])
+    return params
+
+
+def keyset_page(cursor, select, keys, where=(), params=(), descending=True,
+                per_page=DEFAULT_PER_PAGE, after=None, before=None):
+    """Fetch one page of ``select`` ordered by ``keys`` using seek pagination.
+
+    ``keys`` is a list of ``(sql_column, row_key)`` pairs whose last entry is
+    unique (normally the primary key). ``after``/``before`` are cursor tokens
+    from a previous Page; the cost of a page does not depend on its position.
+    """
+    columns = [column for column, _ in keys]
+    where = list(where)
+    params = list(params)
+
+    forward = True
+    seek = decode_cursor(after)
+    if seek is None:
+        seek = decode_cursor(before)
+        forward = seek is None
+    if seek is not None and len(seek) != len(keys):
+        seek, forward = None, True
+
+    if seek is not None:
+        where.append(_seek_condition(columns, descending, forward))
+        params.extend(_seek_params(seek))
+
+    direction = 'DESC' if descending == forward else 'ASC'
+    sql = select
+    if where:
+        sql += ' WHERE ' + ' AND '.join(where)
+    sql += ' ORDER BY ' + ', '.join(f'{column} {direction}' for column in columns)
+    sql += ' LIMIT %s'
+    params.append(per_page + 1)
+
+    cursor.execute(sql, params)
+    rows = list(cursor.fetchall())
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    if not forward:
+        rows.reverse()
+
+    def token(row):
+        return encode_cursor([row[key] for _, key in keys])
+
+    next_cursor = prev_cursor = None
+    if rows:
+        if (forward and has_more) or not forward:
+            next_cursor = token(rows[-1])
+        if (forward and seek is not None) or (not forward and has_more):
+            prev_cursor = token(rows[0])
+    return Page(rows, next_cursor, prev_cursor)
+
+
+def stream_rows(connection, sql, params=(), batch_size=1000):
+    """Yield rows from an unbuffered server-side cursor.
+
+    Rows are pulled ``batch_size`` at a time, so memory stays flat however
+    large the result is. The connection can't run other queries until the
+    generator is exhausted or closed.
+    """
+    cursor = connection.cursor(MySQLdb.cursors.SSDictCursor)
+    try:
+        cursor.execute(sql, params)
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield from rows
+    finally:
+        cursor.close()
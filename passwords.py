@@ -0,0 +1,112 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+DEFAULT_METHOD = 'scrypt:32768:8:1'
+
+
+class HashPoolBusy(Exception):
+    """Raised when no hashing slot frees up within PASSWORD_QUEUE_TIMEOUT."""
+
+
+def needs_rehash(password_hash, method):
+    # Stored hashes look like '<method>$<salt>$<hash>'; anything hashed with
+    # other parameters than the configured method gets upgraded on login
+    return password_hash.split('$', 1)[0] != method
+
+
+def _verify(password_hash, password, method):
+    # Runs in a worker process: check, and rehash in the same round trip if
+    # the stored parameters are out of date
+    if not check_password_hash(password_hash, password):
+        return False, None
+    if needs_rehash(password_hash, method):
+        return True, generate_password_hash(password, method=method)
+    return True, None
+
+
+class PasswordHasher:
+    """Runs password hashing on a per-process pool of worker processes.
+
+    At most ``max_pending`` jobs may be queued or running; callers wait up to
+    ``queue_timeout`` seconds for a slot and then get HashPoolBusy, so a
+    login spike sheds load instead of tying up every request thread.
+    ``workers = 0`` hashes inline on the request thread.
+    """
+
+    def __init__(self, method=DEFAULT_METHOD, workers=2, max_pending=8, queue_timeout=2):
+        self.configure(method, workers, max_pending, queue_timeout)
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._completed = 0
+        self._rejected = 0
+        self._upgraded = 0
+
+    def configure(self, method, workers, max_pending, queue_timeout):
+        self.method = method
+        self.workers = workers
+        self.max_pending = max(max_pending, workers, 1)
+        self.queue_timeout = queue_timeout
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+
+    def init_app(self, app):
+        self.configure(app.config.get('PASSWORD_HASH_METHOD', DEFAULT_METHOD),
+                       app.config.get('PASSWORD_WORKERS', 2),
+                       app.config.get('PASSWORD_MAX_PENDING', 8),
+                       app.config.get('PASSWORD_QUEUE_TIMEOUT', 2))
+        app.extensions['password_hasher'] = self
+
+    def _get_executor(self):
+        # One pool per process; a pool inherited through fork has no workers.
+        # Hashing processes start from the forkserver rather than forking this
+        # one, which has request threads and open database connections.
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context('forkserver'))
+                self._pid = os.getpid()
+            return self._executor
+
+    def _run(self, fn, *args):
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            with self._lock:
+                self._rejected += 1
+            raise HashPoolBusy()
+        with self._lock:
+            self._pending += 1
+        try:
+            if self.workers <= 0:
+                return fn(*args)
+            return self._get_executor().submit(fn, *args).result()
+        finally:
+            with self._lock:
+                self._pending -= 1
+                self._completed += 1
+            self._slots.release()
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, password_hash, password):
+        """Returns (matches, upgraded hash or None)."""
+        ok, new_hash = self._run(_verify, password_hash, password, self.method)
+        if new_hash:
+            with self._lock:
+                self._upgraded += 1
+        return ok, new_hash
+
+    def stats(self):
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'max_pending': self.max_pending,
+                'queue_depth': self._pending,
+                'completed': self._completed,
+                'rejected': self._rejected,
+                'upgraded': self._upgraded,
+            }
@@ -0,0 +1,197 @@
+"""Token-bucket rate limits and admission control for the hot write paths.
+
+Buckets live in a small hash table in a memory-mapped file (RATE_LIMIT_FILE),
+so every worker process on the host draws from the same buckets: a client
+gets the same budget whichever worker answers. Each rule in RATE_LIMITS is
+``(burst, period)``: up to ``burst`` requests at once, refilled at
+``burst / period`` per second.
+
+Views opt in with ``@rate_limiter.limit(scope, by=...)``, listed above
+``@login_required`` so a rejected request is turned away before it loads the
+user or takes a database connection. On top of the buckets, at most
+RATE_LIMIT_MAX_CONCURRENT limited requests run at once per worker; the rest
+are shed straight away. Both answer 429 with a Retry-After header.
+"""
+import fcntl
+import hashlib
+import math
+import mmap
+import os
+import struct
+import threading
+import time
+from collections import Counter
+from functools import wraps
+
+from flask import request, session
+from werkzeug.exceptions import TooManyRequests
+
+SLOT = struct.Struct('<Qdd')  # key hash, tokens, last update (time.time())
+WAYS = 8  # a key lives in one of the 8 slots of its set
+
+# What each bucket is keyed on. None skips the bucket for this request.
+KEY_FUNCTIONS = {
+    'ip': lambda: request.remote_addr,
+    # Straight from the signed session, so no user lookup is needed
+    'user': lambda: session.get('_user_id'),
+    'event': lambda: request.view_args.get('event_id'),
+    'username': lambda: (request.form.get('username') or '').strip().lower() or None,
+}
+
+
+class BucketTable:
+    """Fixed-size set-associative table of token buckets.
+
+    Keys are hashed to one set of WAYS slots; a new key takes an empty slot
+    or evicts the one used least recently, which at worst hands that key a
+    full bucket again. Each set is locked with a byte-range lock on the
+    file, so workers only wait for each other on the same set.
+    """
+
+    def __init__(self, path=None, sets=4096):
+        self.path = path
+        self.sets = sets
+        self.size = sets * WAYS * SLOT.size
+        self._buf = None
+        self._fd = None
+        self._lock = threading.Lock()  # file locks don't exclude threads of one process
+        self.evictions = 0
+
+    def _map(self):
+        # Opened on first use; the mapping and descriptor survive a fork, and
+        # lockf locks belong to the process, so forked workers can share them
+        if self._buf is None:
+            if self.path is None:
+                self._buf = mmap.mmap(-1, self.size)
+            else:
+                os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+                fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+                fcntl.lockf(fd, fcntl.LOCK_EX)
+                try:
+                    if os.fstat(fd).st_size != self.size:
+                        # New file, or RATE_LIMIT_SETS changed: start empty
+                        os.ftruncate(fd, 0)
+                        os.ftruncate(fd, self.size)
+                finally:
+                    fcntl.lockf(fd, fcntl.LOCK_UN)
+                self._buf = mmap.mmap(fd, self.size)
+                self._fd = fd
+        return self._buf
+
+    def take(self, key, burst, rate):
+        """Take a token from key's bucket. Returns 0, or seconds until one is free."""
+        digest = int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), 'little') or 1
+        first = digest % self.sets * WAYS
+        offset, length = first * SLOT.size, WAYS * SLOT.size
+        with self._lock:
+            buf = self._map()
+            if self._fd is not None:
+                fcntl.lockf(self._fd, fcntl.LOCK_EX, length, offset)
+            try:
+                now = time.time()
+                victim = oldest = None
+                victim_key = 0
+                for slot in range(first, first + WAYS):
+                    stored, tokens, updated = SLOT.unpack_from(buf, slot * SLOT.size)
+                    if stored == digest:
+                        # A clock step backwards refills the bucket rather than emptying it
+                        elapsed = now - updated
+                        tokens = burst if elapsed < 0 else min(burst, tokens + elapsed * rate)
+                        break
+                    if victim is None or updated < oldest:
+                        victim, oldest, victim_key = slot, updated, stored
+                else:
+                    slot, tokens = victim, burst
+                    if victim_key:
+                        self.evictions += 1
+                if tokens >= 1:
+                    SLOT.pack_into(buf, slot * SLOT.size, digest, tokens - 1, now)
+                    return 0.0
+                SLOT.pack_into(buf, slot * SLOT.size, digest, tokens, now)
+                return (1 - tokens) / rate
+            finally:
+                if self._fd is not None:
+                    fcntl.lockf(self._fd, fcntl.LOCK_UN, length, offset)
+
+
+class RateLimiter:
+    def __init__(self):
+        self.enabled = True
+        self.rules = {}
+        self.table = BucketTable()
+        self.max_concurrent = 0
+        self._slots = None
+        self._lock = threading.Lock()
+        self.allowed = Counter()
+        self.rejected = Counter()
+        self.shed = 0
+        self.in_flight = 0
+
+    def init_app(self, app):
+        config = app.config
+        self.enabled = config.get('RATE_LIMIT_ENABLED', True)
+        self.rules = {name: (burst, burst / period)
+                      for name, (burst, period) in config.get('RATE_LIMITS', {}).items()}
+        self.table = BucketTable(config.get('RATE_LIMIT_FILE'), config.get('RATE_LIMIT_SETS', 4096))
+        self.max_concurrent = config.get('RATE_LIMIT_MAX_CONCURRENT', 0)
+        self._slots = threading.BoundedSemaphore(self.max_concurrent) if self.max_concurrent else None
+        app.extensions['rate_limiter'] = self
+
+    def check(self, scope, by):
+        # Buckets are taken in order and the first empty one rejects, so list
+        # the narrowest key first: a client that is over its own limit then
+        # never drains a shared bucket such as the event's
+        for key_name in by:
+            rule = f'{scope}_{key_name}'
+            if rule not in self.rules:
+                continue
+            key = KEY_FUNCTIONS[key_name]()
+            if key is None:
+                continue
+            burst, rate = self.rules[rule]
+            wait = self.table.take(f'{rule}:{key}', burst, rate)
+            with self._lock:
+                if wait:
+                    self.rejected[rule] += 1
+                else:
+                    self.allowed[rule] += 1
+            if wait:
+                raise TooManyRequests(retry_after=max(1, math.ceil(wait)))
+
+    def limit(self, scope, by, methods=('POST',)):
+        """Apply the ``<scope>_<key>`` rules for each key in ``by`` to a view."""
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                if not self.enabled or request.method not in methods:
+                    return view(*args, **kwargs)
+                self.check(scope, by)
+                if self._slots is None:
+                    return view(*args, **kwargs)
+                if not self._slots.acquire(blocking=False):
+                    with self._lock:
+                        self.shed += 1
+                    raise TooManyRequests(retry_after=1)
+                with self._lock:
+                    self.in_flight += 1
+                try:
+                    return view(*args, **kwargs)
+                finally:
+                    with self._lock:
+                        self.in_flight -= 1
+                    self._slots.release()
+            return wrapper
+        return decorator
+
+    def stats(self):
+        with self._lock:
+            stats = {
+                'in_flight': self.in_flight,
+                'max_concurrent': self.max_concurrent,
+                'shed': self.shed,
+                'evictions': self.table.evictions,
+            }
+            for rule in self.rules:
+                stats[f'allowed_{rule}'] = self.allowed[rule]
+                stats[f'rejected_{rule}'] = self.rejected[rule]
+            return stats
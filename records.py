@@ -0,0 +1,69 @@
+from datetime import time, timedelta
+
+
+def parse_time(value):
+    # MySQL TIME -> datetime.time. Columns here hold times of day, but TIME
+    # can also be negative or over 24h, so fall back to timedelta for those.
+    if value is None:
+        return None
+    if isinstance(value, (bytes, bytearray)):
+        value = value.decode('ascii')
+    try:
+        return time.fromisoformat(value)
+    except ValueError:
+        negative = value.startswith('-')
+        hours, minutes, seconds = value.lstrip('-').split(':')
+        delta = timedelta(hours=int(hours), minutes=int(minutes), seconds=float(seconds))
+        return -delta if negative else delta
+
+
+class Record:
+    """Base for compact, read-only result rows.
+
+    Subclasses list their columns in ``__slots__``; columns missing from the
+    row default to None and extra columns are ignored. Item access is kept
+    so code written against DictCursor rows keeps working.
+    """
+    __slots__ = ()
+
+    @classmethod
+    def from_row(cls, row):
+        record = cls.__new__(cls)
+        get = row.get
+        for name in cls.__slots__:
+            object.__setattr__(record, name, get(name))
+        return record
+
+    @classmethod
+    def from_rows(cls, rows):
+        from_row = cls.from_row
+        return [from_row(row) for row in rows]
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def get(self, key, default=None):
+        return getattr(self, key, default)
+
+    def __repr__(self):
+        fields = ', '.join(f'{name}={getattr(self, name)!r}' for name in self.__slots__)
+        return f'{type(self).__name__}({fields})'
+
+
+class EventRecord(Record):
+    __slots__ = ('id', 'title', 'description', 'date', 'time', 'location', 'capacity',
+                 'registered_count', 'version', 'image_url', 'status', 'created_by', 'created_at')
+
+
+class RegisteredEventRecord(Record):
+    # An event joined with the current user's registration
+    __slots__ = EventRecord.__slots__ + ('registration_date',)
+
+
+class EventRequestRecord(Record):
+    __slots__ = ('id', 'title', 'description', 'proposed_date', 'proposed_time', 'location',
+                 'capacity', 'requested_by', 'requester_name', 'status', 'admin_remarks',
+                 'image_url', 'created_at')
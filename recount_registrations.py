@@ -0,0 +1,62 @@
+import argparse
+from flask import Flask
+import MySQLdb.cursors
+from config import Config
+from db import MySQLPool
+import stats
+
+app = Flask(__name__)
+app.config.from_object(Config)
+mysql = MySQLPool(app)
+
+def find_drifted_events(cursor):
+    # Events whose stored counter no longer matches event_registrations
+    cursor.execute('''
+        SELECT e.id, e.title, e.registered_count, COUNT(er.id) as actual_count
+        FROM events e
+        LEFT JOIN event_registrations er ON e.id = er.event_id
+        GROUP BY e.id
+        HAVING e.registered_count <> actual_count
+    ''')
+    return cursor.fetchall()
+
+def recount_registrations(check_only=False):
+    try:
+        cursor = mysql.connection.cursor(MySQLdb.cursors.DictCursor)
+        drifted = find_drifted_events(cursor)
+
+        for event in drifted:
+            print(f"Event {event['id']} ({event['title']}): "
+                  f"stored {event['registered_count']}, actual {event['actual_count']}")
+
+        if check_only:
+            print(f"{len(drifted)} event(s) out of sync.")
+            cursor.close()
+            return len(drifted) == 0
+
+        cursor.execute('''
+            UPDATE events e
+            SET e.registered_count = (
+                SELECT COUNT(*) FROM event_registrations er WHERE er.event_id = e.id
+            )
+        ''')
+        # The dashboard totals are derived from the counters
+        stats.rebuild(cursor)
+        mysql.connection.commit()
+        cursor.close()
+        print(f"Rebuilt registration counts ({len(drifted)} event(s) corrected) and dashboard stats.")
+        return True
+
+    except Exception as e:
+        print(f"Error recounting registrations: {e}")
+        return False
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Rebuild or check events.registered_count and the dashboard stats')
+    parser.add_argument('--check', action='store_true',
+                        help='only report events whose counter is out of sync')
+    args = parser.parse_args()
+
+    with app.app_context():
+        ok = recount_registrations(check_only=args.check)
+    raise SystemExit(0 if ok else 1)
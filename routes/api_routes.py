@@ -0,0 +1,188 @@
+import hashlib
+import json
+from datetime import date, time, timedelta
+
+from flask import Blueprint, Response, jsonify, request, url_for
+import MySQLdb.cursors
+
+try:
+    import orjson
+except ImportError:  # falls back to the standard library encoder
+    orjson = None
+
+from app import mysql
+from pagination import MAX_PER_PAGE, keyset_page, parse_ids, per_page_arg
+
+api_bp = Blueprint('api', __name__, url_prefix='/api')
+
+# Public fields, and the events columns each one needs
+FIELDS = {
+    'id': ('id',),
+    'title': ('title',),
+    'description': ('description',),
+    'date': ('date',),
+    'time': ('time',),
+    'location': ('location',),
+    'capacity': ('capacity',),
+    'registered_count': ('registered_count',),
+    'seats_left': ('capacity', 'registered_count'),
+    'image_url': ('image_url',),
+    'url': ('id',),
+}
+# Always selected: the keyset columns and the version the ETag is built from
+BASE_COLUMNS = ('id', 'date', 'time', 'version')
+
+
+class FieldError(ValueError):
+    pass
+
+
+def _default(value):
+    # Only reached with the standard library encoder; orjson handles dates itself
+    if isinstance(value, (date, time)):
+        return value.isoformat()
+    if isinstance(value, timedelta):
+        return str(value)
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+
+def dumps(data):
+    if orjson is not None:
+        return orjson.dumps(data, default=_default)
+    return json.dumps(data, separators=(',', ':'), default=_default).encode()
+
+
+def selected_fields(args):
+    raw = args.get('fields')
+    if not raw:
+        return list(FIELDS)
+    fields = list(dict.fromkeys(field.strip() for field in raw.split(',') if field.strip()))
+    unknown = [field for field in fields if field not in FIELDS]
+    if unknown or not fields:
+        raise FieldError(f"Unknown field(s): {', '.join(unknown) or raw}")
+    return fields
+
+
+def select_list(fields):
+    # Only fetch the columns the requested fields need; description is a
+    # TEXT column and most of the row
+    columns = dict.fromkeys(BASE_COLUMNS)
+    for field in fields:
+        columns.update(dict.fromkeys(FIELDS[field]))
+    return ', '.join(f'e.{column}' for column in columns)
+
+
+def field_value(row, field):
+    if field == 'seats_left':
+        return row['capacity'] - row['registered_count']
+    if field == 'image_url':
+        return url_for('static', filename='uploads/' + row['image_url'], _external=True) \
+            if row['image_url'] else None
+    if field == 'url':
+        return url_for('main.event_details', event_id=row['id'], _external=True)
+    return row[field]
+
+
+def serialize(rows, fields):
+    return [{field: field_value(row, field) for field in fields} for row in rows]
+
+
+def etag_for(rows, *extra):
+    # Changes whenever any returned event changes (its version moves), an
+    # event joins or leaves the result, or the request asks for other fields
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(repr(extra).encode())
+    for row in rows:
+        digest.update(b'%d:%d;' % (row['id'], row['version']))
+    return digest.hexdigest()
+
+
+def conditional(etag, build):
+    """304 if the client has this ETag, otherwise the JSON from build()."""
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = Response(dumps(build()), mimetype='application/json')
+    response.set_etag(etag)
+    response.cache_control.public = True
+    response.cache_control.no_cache = True
+    return response
+
+
+def error(message, status=400):
+    return jsonify({'error': message}), status
+
+
+def fetch_by_ids(ids, fields):
+    cursor = mysql.connection.cursor(MySQLdb.cursors.DictCursor)
+    cursor.execute(
+        f"SELECT {select_list(fields)} FROM events e WHERE e.status = 'published' AND e.id IN (%s)"
+        % ', '.join(['%s'] * len(ids)),
+        ids
+    )
+    by_id = {row['id']: row for row in cursor.fetchall()}
+    cursor.close()
+    return by_id
+
+
+@api_bp.route('/events')
+@mysql.replica_reads
+def events():
+    """Upcoming published events, oldest first, as on main.index.
+
+    ?fields=a,b picks fields, ?per_page/after/before page through them and
+    ?ids=1,2,3 looks events up in one request instead.
+    """
+    try:
+        fields = selected_fields(request.args)
+    except FieldError as e:
+        return error(str(e))
+
+    if 'ids' in request.args:
+        ids = parse_ids(request.args['ids'])
+        if not ids:
+            return error('ids must be a comma-separated list of event ids')
+        if len(ids) > MAX_PER_PAGE:
+            return error(f'At most {MAX_PER_PAGE} ids per request')
+        by_id = fetch_by_ids(ids, fields)
+        rows = [by_id[event_id] for event_id in ids if event_id in by_id]
+        missing = [event_id for event_id in ids if event_id not in by_id]
+        return conditional(etag_for(rows, fields, missing),
+                           lambda: {'events': serialize(rows, fields), 'missing': missing})
+
+    per_page = per_page_arg(request.args)
+    cursor = mysql.connection.cursor(MySQLdb.cursors.DictCursor)
+    page = keyset_page(
+        cursor, f'SELECT {select_list(fields)} FROM events e',
+        keys=[('e.date', 'date'), ('e.time', 'time'), ('e.id', 'id')],
+        where=["e.status = 'published'", 'e.date >= CURDATE()'],
+        descending=False, per_page=per_page,
+        after=request.args.get('after'), before=request.args.get('before'),
+    )
+    cursor.close()
+
+    def link(**cursor_arg):
+        args = {'per_page': per_page, **cursor_arg}
+        if 'fields' in request.args:
+            args['fields'] = ','.join(fields)
+        return url_for('api.events', **args)
+
+    etag = etag_for(page.items, fields, per_page, page.next_cursor, page.prev_cursor)
+    return conditional(etag, lambda: {
+        'events': serialize(page.items, fields),
+        'next': link(after=page.next_cursor) if page.next_cursor else None,
+        'prev': link(before=page.prev_cursor) if page.prev_cursor else None,
+    })
+
+
+@api_bp.route('/events/<int:event_id>')
+@mysql.replica_reads
+def event(event_id):
+    try:
+        fields = selected_fields(request.args)
+    except FieldError as e:
+        return error(str(e))
+    row = fetch_by_ids([event_id], fields).get(event_id)
+    if row is None:
+        return error('Event not found', 404)
+    return conditional(etag_for([row], fields), lambda: serialize([row], fields)[0])
@@ -1,13 +1,14 @@
 from flask import Blueprint, render_template, request, flash, redirect, url_for, session
 from flask_login import login_user, logout_user, login_required, current_user
-from werkzeug.security import generate_password_hash, check_password_hash
-from app import mysql
+from app import mysql, password_hasher, rate_limiter
 import MySQLdb.cursors
-from app import User  # Import the User class from app.py
+from app import User, user_cache  # Import the User class from app.py
+from passwords import HashPoolBusy
 
 auth_bp = Blueprint('auth', __name__)
 
 @auth_bp.route('/login', methods=['GET', 'POST'])
+@rate_limiter.limit('login', by=('username', 'ip'))
 def login():
     if current_user.is_authenticated:
         return redirect(url_for('main.index'))
@@ -20,9 +21,27 @@ def login():
         cursor.execute('SELECT * FROM users WHERE username = %s', (username,))
         user_data = cursor.fetchone()
         cursor.close()
+        # Don't hold a pooled connection while the password is checked
+        mysql.release()
         
-        if user_data and check_password_hash(user_data['password_hash'], password):
+        valid = False
+        if user_data:
+            try:
+                valid, new_hash = password_hasher.verify(user_data['password_hash'], password)
+            except HashPoolBusy:
+                flash('The server is busy right now. Please try logging in again in a moment.', 'error')
+                return render_template('auth/login.html'), 503
+            if new_hash:
+                # Hashing parameters changed since this password was stored
+                cursor = mysql.connection.cursor()
+                cursor.execute('UPDATE users SET password_hash = %s WHERE id = %s AND password_hash = %s',
+                               (new_hash, user_data['id'], user_data['password_hash']))
+                mysql.connection.commit()
+                cursor.close()
+        
+        if valid:
             user = User(user_data)  # Create User object
+            user_cache.set(user.get_id(), user)
             login_user(user)
             flash('Logged in successfully!', 'success')
             next_page = request.args.get('next')
@@ -32,6 +51,7 @@ def login():
     return render_template('auth/login.html')
 
 @auth_bp.route('/register', methods=['GET', 'POST'])
+@rate_limiter.limit('signup', by=('ip',))
 def register():
     if current_user.is_authenticated:
         return redirect(url_for('main.index'))
@@ -48,13 +68,26 @@ def register():
         if existing_user:
             flash('Username or email already exists', 'error')
         else:
-            cursor.execute(
-                'INSERT INTO users (username, email, password_hash) VALUES (%s, %s, %s)',
-                (username, email, generate_password_hash(password))
-            )
-            mysql.connection.commit()
-            flash('Registration successful! Please login.', 'success')
-            return redirect(url_for('auth.login'))
+            cursor.close()
+            mysql.release()
+            try:
+                password_hash = password_hasher.hash(password)
+            except HashPoolBusy:
+                flash('The server is busy right now. Please try again in a moment.', 'error')
+                return render_template('auth/register.html'), 503
+            cursor = mysql.connection.cursor(MySQLdb.cursors.DictCursor)
+            try:
+                cursor.execute(
+                    'INSERT INTO users (username, email, password_hash) VALUES (%s, %s, %s)',
+                    (username, email, password_hash)
+                )
+                mysql.connection.commit()
+                flash('Registration successful! Please login.', 'success')
+                return redirect(url_for('auth.login'))
+            except MySQLdb.IntegrityError:
+                # Someone took the name while the password was being hashed
+                mysql.connection.rollback()
+                flash('Username or email already exists', 'error')
         cursor.close()
     
     return render_template('auth/register.html')
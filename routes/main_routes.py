@@ -1,116 +1,239 @@
-from flask import Blueprint, render_template, request, flash, redirect, url_for
+from flask import Blueprint, render_template, request, flash, redirect, url_for, jsonify
 from flask_login import login_required, current_user
-from app import mysql
+from app import mysql, rate_limiter
+from page_cache import cached_page, invalidate_seats
+from records import EventRecord, EventRequestRecord, RegisteredEventRecord
+from pagination import MAX_PER_PAGE, parse_ids, per_page_arg
+from search import search_events, suggest_titles
+from seat_stream import seat_publisher
+from stats import counter_changed, registrations_changed
+from notifications import notify_users
+from uploads import stage_upload, publish_upload, discard_upload, add_reference, upload_folder
 import MySQLdb.cursors
-from datetime import datetime
-import os
-from werkzeug.utils import secure_filename
+import logging
+from PIL import Image
 
 main_bp = Blueprint('main', __name__)
+logger = logging.getLogger(__name__)
 
 # Add these configurations at the top of the file
-UPLOAD_FOLDER = 'static/uploads'
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def reserve_seat(cursor, event_id):
+    # Claim a seat with a single conditional UPDATE. The row lock it takes
+    # serialises concurrent registrations, so registered_count can never
+    # exceed capacity. The caller commits or rolls back.
+    cursor.execute('''
+        UPDATE events SET registered_count = registered_count + 1
+        WHERE id = %s AND registered_count < capacity
+    ''', (event_id,))
+    return cursor.rowcount == 1
+
+def promote_waitlist(cursor, event_id):
+    # Move users from the waitlist into free seats, oldest entry first.
+    # Runs inside the caller's transaction.
+    cursor.execute('''
+        SELECT capacity, registered_count FROM events WHERE id = %s FOR UPDATE
+    ''', (event_id,))
+    event = cursor.fetchone()
+    if not event or event['registered_count'] >= event['capacity']:
+        return 0
+    
+    cursor.execute('''
+        SELECT id, user_id FROM event_waitlist 
+        WHERE event_id = %s 
+        ORDER BY id ASC 
+        LIMIT %s
+        FOR UPDATE
+    ''', (event_id, event['capacity'] - event['registered_count']))
+    waiting = cursor.fetchall()
+    if not waiting:
+        return 0
+    
+    # Someone who registered directly while waiting already has a seat: they
+    # take no new one and get no promotion e-mail. The event row lock keeps
+    # this set from changing before the insert.
+    user_ids = [entry['user_id'] for entry in waiting]
+    cursor.execute(
+        'SELECT user_id FROM event_registrations WHERE event_id = %%s AND user_id IN (%s)'
+        % ', '.join(['%s'] * len(user_ids)),
+        [event_id] + user_ids
+    )
+    already = {row['user_id'] for row in cursor.fetchall()}
+    promoted_ids = [user_id for user_id in user_ids if user_id not in already]
+    
+    if promoted_ids:
+        cursor.executemany('''
+            INSERT INTO event_registrations (event_id, user_id)
+            VALUES (%s, %s)
+        ''', [(event_id, user_id) for user_id in promoted_ids])
+    promoted = len(promoted_ids)
+    
+    ids = [entry['id'] for entry in waiting]
+    cursor.execute(
+        'DELETE FROM event_waitlist WHERE id IN (%s)' % ', '.join(['%s'] * len(ids)),
+        ids
+    )
+    cursor.execute('''
+        UPDATE events SET registered_count = registered_count + %s
+        WHERE id = %s
+    ''', (promoted, event_id))
+    registrations_changed(cursor, event_id, registered=promoted)
+    notify_users(cursor, 'waitlist_promoted', event_id, promoted_ids)
+    return promoted
+
 @main_bp.route('/')
+@mysql.replica_reads
+@cached_page
 def index():
     cursor = mysql.connection.cursor(MySQLdb.cursors.DictCursor)
     cursor.execute('''
-        SELECT e.*, COUNT(er.id) as registered_count,
-        DATE_FORMAT(e.date, '%%Y-%%m-%%d') as formatted_date,
-        DATE_FORMAT(e.time, '%%H:%%i:%%s') as formatted_time
+        SELECT e.*
         FROM events e 
-        LEFT JOIN event_registrations er ON e.id = er.event_id 
         WHERE e.status = 'published' AND e.date >= CURDATE()
-        GROUP BY e.id 
         ORDER BY e.date ASC
     ''')
-    events = cursor.fetchall()
-    
-    # Convert string dates and times to datetime objects
-    for event in events:
-        try:
-            event['date'] = datetime.strptime(event['formatted_date'], '%Y-%m-%d')
-            event['time'] = datetime.strptime(event['formatted_time'], '%H:%M:%S')
-        except (ValueError, TypeError):
-            # Handle any conversion errors
-            event['date'] = datetime.now()
-            event['time'] = datetime.now()
-            
+    events = EventRecord.from_rows(cursor.fetchall())
     cursor.close()
     return render_template('main/index.html', events=events)
 
+@main_bp.route('/search')
+@mysql.replica_reads
+def search():
+    q = request.args.get('q', '').strip()
+    cursor = mysql.connection.cursor(MySQLdb.cursors.DictCursor)
+    page = search_events(cursor, q, per_page=per_page_arg(request.args, default=20),
+                         after=request.args.get('after'), before=request.args.get('before'))
+    cursor.close()
+    events = EventRecord.from_rows(page.items) if page else []
+    return render_template('main/search.html', q=q, events=events, page=page)
+
+@main_bp.route('/search/suggest')
+@mysql.replica_reads
+def search_suggest():
+    # Autocomplete: a few titles matching what has been typed so far
+    cursor = mysql.connection.cursor(MySQLdb.cursors.DictCursor)
+    rows = suggest_titles(cursor, request.args.get('q', ''))
+    cursor.close()
+    response = jsonify([{'id': row['id'], 'title': row['title'],
+                         'url': url_for('main.event_details', event_id=row['id'])} for row in rows])
+    response.cache_control.max_age = 30
+    return response
+
 @main_bp.route('/event/<int:event_id>')
+@mysql.replica_reads
 def event_details(event_id):
     cursor = mysql.connection.cursor(MySQLdb.cursors.DictCursor)
     cursor.execute('''
-        SELECT e.*, COUNT(er.id) as registered_count,
-        DATE_FORMAT(e.date, '%%Y-%%m-%%d') as formatted_date,
-        DATE_FORMAT(e.time, '%%H:%%i:%%s') as formatted_time
+        SELECT e.*
         FROM events e 
-        LEFT JOIN event_registrations er ON e.id = er.event_id 
         WHERE e.id = %s
-        GROUP BY e.id
     ''', (event_id,))
-    event = cursor.fetchone()
-    
-    if event:
-        # Convert string dates to datetime objects
-        try:
-            event['date'] = datetime.strptime(event['formatted_date'], '%Y-%m-%d')
-            event['time'] = datetime.strptime(event['formatted_time'], '%H:%M:%S')
-        except (ValueError, TypeError):
-            event['date'] = datetime.now()
-            event['time'] = datetime.now()
+    row = cursor.fetchone()
+    event = EventRecord.from_row(row) if row else None
     
     is_registered = False
+    waitlist_position = 0
     if current_user.is_authenticated:
         cursor.execute('''
             SELECT * FROM event_registrations 
             WHERE event_id = %s AND user_id = %s
         ''', (event_id, current_user.id))
         is_registered = cursor.fetchone() is not None
+        
+        if not is_registered:
+            cursor.execute('''
+                SELECT COUNT(*) as position 
+                FROM event_waitlist w 
+                JOIN event_waitlist mine ON mine.event_id = w.event_id AND mine.user_id = %s 
+                WHERE w.event_id = %s AND w.id <= mine.id
+            ''', (current_user.id, event_id))
+            waitlist_position = cursor.fetchone()['position']
     
     cursor.close()
-    return render_template('main/event_details.html', event=event, is_registered=is_registered)
+    return render_template('main/event_details.html', event=event, is_registered=is_registered,
+                           waitlist_position=waitlist_position)
+
+@main_bp.route('/event/<int:event_id>/seats/stream')
+def event_seats_stream(event_id):
+    # Server-Sent Events with this event's seats left (see seat_stream.py)
+    return seat_publisher.response([event_id])
+
+@main_bp.route('/events/seats/stream')
+def seats_stream():
+    # One stream for a whole listing: ?ids=1,2,3
+    event_ids = parse_ids(request.args.get('ids', ''))
+    if not event_ids or len(event_ids) > MAX_PER_PAGE:
+        return f'ids must list 1 to {MAX_PER_PAGE} event ids\n', 400, {'Content-Type': 'text/plain'}
+    return seat_publisher.response(event_ids)
 
 @main_bp.route('/event/<int:event_id>/register', methods=['POST'])
+@rate_limiter.limit('register', by=('user', 'ip', 'event'))
 @login_required
 def register_event(event_id):
     cursor = mysql.connection.cursor(MySQLdb.cursors.DictCursor)
     
-    # Check if event exists and has capacity
-    cursor.execute('''
-        SELECT e.*, COUNT(er.id) as registered_count 
-        FROM events e 
-        LEFT JOIN event_registrations er ON e.id = er.event_id 
-        WHERE e.id = %s
-        GROUP BY e.id
-    ''', (event_id,))
-    event = cursor.fetchone()
-    
-    if not event:
-        flash('Event not found', 'error')
-        return redirect(url_for('main.index'))
-    
-    if event['registered_count'] >= event['capacity']:
-        flash('Event is full', 'error')
-        return redirect(url_for('main.event_details', event_id=event_id))
-    
     try:
+        seated = reserve_seat(cursor, event_id)
+        if not seated:
+            # Full, or no such event. Lock the event row, as cancel_registration
+            # does, and try once more: a cancellation that committed in between
+            # promoted nobody, since this user wasn't on the waitlist yet
+            cursor.execute('SELECT id FROM events WHERE id = %s FOR UPDATE', (event_id,))
+            if not cursor.fetchone():
+                mysql.connection.rollback()
+                flash('Event not found', 'error')
+                return redirect(url_for('main.index'))
+            seated = reserve_seat(cursor, event_id)
+        
+        if seated:
+            cursor.execute('''
+                INSERT INTO event_registrations (event_id, user_id)
+                VALUES (%s, %s)
+            ''', (event_id, current_user.id))
+            cursor.execute('''
+                DELETE FROM event_waitlist 
+                WHERE event_id = %s AND user_id = %s
+            ''', (event_id, current_user.id))
+            registrations_changed(cursor, event_id, registered=1)
+            notify_users(cursor, 'registration_confirmed', event_id, [current_user.id])
+            mysql.connection.commit()
+            invalidate_seats(event_id)
+            seat_publisher.notify(event_id)
+            flash('Successfully registered for the event!', 'success')
+            return redirect(url_for('main.event_details', event_id=event_id))
+        
+        # Still full, and the lock is held until the waitlist row is committed,
+        # so the next cancellation's promote_waitlist sees it
         cursor.execute('''
-            INSERT INTO event_registrations (event_id, user_id)
-            VALUES (%s, %s)
+            SELECT id FROM event_registrations 
+            WHERE event_id = %s AND user_id = %s
         ''', (event_id, current_user.id))
-        mysql.connection.commit()
-        flash('Successfully registered for the event!', 'success')
+        if cursor.fetchone():
+            mysql.connection.rollback()
+            flash('You are already registered for this event', 'error')
+            return redirect(url_for('main.event_details', event_id=event_id))
+        
+        try:
+            cursor.execute('''
+                INSERT INTO event_waitlist (event_id, user_id)
+                VALUES (%s, %s)
+            ''', (event_id, current_user.id))
+            mysql.connection.commit()
+            flash('Event is full. You have been added to the waitlist.', 'info')
+        except MySQLdb.IntegrityError:
+            mysql.connection.rollback()
+            flash('You are already on the waitlist for this event', 'error')
     except MySQLdb.IntegrityError:
+        # Undo the seat claimed above
+        mysql.connection.rollback()
         flash('You are already registered for this event', 'error')
+    finally:
+        cursor.close()
     
-    cursor.close()
     return redirect(url_for('main.event_details', event_id=event_id))
 
 @main_bp.route('/request-event', methods=['GET', 'POST'])
@@ -124,25 +247,42 @@ def request_event():
         location = request.form.get('location')
         capacity = request.form.get('capacity')
         
-        # Handle image upload
-        image_filename = None
+        # Handle image upload: the bytes are hashed into a temp file and
+        # published under their content hash once the request row is saved
+        staged = None
         if 'image' in request.files:
             image = request.files['image']
             if image and allowed_file(image.filename):
-                # Create unique filename
-                filename = secure_filename(image.filename)
-                timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-                image_filename = f"{timestamp}_{filename}"
-                image.save(os.path.join(UPLOAD_FOLDER, image_filename))
+                extension = image.filename.rsplit('.', 1)[1].lower()
+                try:
+                    staged = stage_upload(image, upload_folder(), extension)
+                except (OSError, Image.DecompressionBombError):
+                    # DecompressionBombError is not an OSError
+                    flash('The image could not be read. Please upload a PNG, JPEG or GIF file.', 'error')
+                    return redirect(url_for('main.request_event'))
         
         cursor = mysql.connection.cursor(MySQLdb.cursors.DictCursor)
-        cursor.execute('''
-            INSERT INTO event_requests 
-            (title, description, proposed_date, proposed_time, location, capacity, requested_by, image_url)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-        ''', (title, description, date, time, location, capacity, current_user.id, image_filename))
-        mysql.connection.commit()
-        cursor.close()
+        try:
+            cursor.execute('''
+                INSERT INTO event_requests 
+                (title, description, proposed_date, proposed_time, location, capacity, requested_by, image_url)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+            ''', (title, description, date, time, location, capacity, current_user.id,
+                  staged.filename if staged else None))
+            if staged:
+                add_reference(cursor, staged.filename, staged.size)
+            counter_changed(cursor, 'pending_requests', 1)
+            mysql.connection.commit()
+        except Exception:
+            mysql.connection.rollback()
+            if staged:
+                discard_upload(staged)
+            raise
+        finally:
+            cursor.close()
+        
+        if staged:
+            publish_upload(staged, upload_folder())
         
         flash('Event request submitted successfully!', 'success')
         return redirect(url_for('main.my_requests'))
@@ -150,62 +290,33 @@ def request_event():
     return render_template('main/request_event.html')
 
 @main_bp.route('/my-requests')
+@mysql.replica_reads
 @login_required
 def my_requests():
     cursor = mysql.connection.cursor(MySQLdb.cursors.DictCursor)
     cursor.execute('''
-        SELECT *, 
-        DATE_FORMAT(proposed_date, '%%Y-%%m-%%d') as formatted_date,
-        DATE_FORMAT(proposed_time, '%%H:%%i:%%s') as formatted_time,
-        DATE_FORMAT(created_at, '%%Y-%%m-%%d %%H:%%i:%%s') as formatted_created_at
+        SELECT * 
         FROM event_requests 
         WHERE requested_by = %s 
         ORDER BY created_at DESC
     ''', (current_user.id,))
-    requests = cursor.fetchall()
-    
-    # Convert string dates to datetime objects
-    for request in requests:
-        try:
-            request['proposed_date'] = datetime.strptime(request['formatted_date'], '%Y-%m-%d')
-            request['proposed_time'] = datetime.strptime(request['formatted_time'], '%H:%M:%S')
-            request['created_at'] = datetime.strptime(request['formatted_created_at'], '%Y-%m-%d %H:%M:%S')
-        except (ValueError, TypeError):
-            # Handle any conversion errors
-            request['proposed_date'] = datetime.now()
-            request['proposed_time'] = datetime.now()
-            request['created_at'] = datetime.now()
-            
+    requests = EventRequestRecord.from_rows(cursor.fetchall())
     cursor.close()
     return render_template('main/my_requests.html', requests=requests)
 
 @main_bp.route('/my-registrations')
+@mysql.replica_reads
 @login_required
 def my_registrations():
     cursor = mysql.connection.cursor(MySQLdb.cursors.DictCursor)
     cursor.execute('''
-        SELECT e.*, er.registration_date,
-        DATE_FORMAT(e.date, '%%Y-%%m-%%d') as formatted_date,
-        DATE_FORMAT(e.time, '%%H:%%i:%%s') as formatted_time,
-        DATE_FORMAT(er.registration_date, '%%Y-%%m-%%d %%H:%%i:%%s') as formatted_registration_date
+        SELECT e.*, er.registration_date
         FROM events e 
         JOIN event_registrations er ON e.id = er.event_id 
         WHERE er.user_id = %s 
         ORDER BY e.date ASC
     ''', (current_user.id,))
-    registrations = cursor.fetchall()
-    
-    # Convert string dates to datetime objects
-    for registration in registrations:
-        try:
-            registration['date'] = datetime.strptime(registration['formatted_date'], '%Y-%m-%d')
-            registration['time'] = datetime.strptime(registration['formatted_time'], '%H:%M:%S')
-            registration['registration_date'] = datetime.strptime(registration['formatted_registration_date'], '%Y-%m-%d %H:%M:%S')
-        except (ValueError, TypeError):
-            registration['date'] = datetime.now()
-            registration['time'] = datetime.now()
-            registration['registration_date'] = datetime.now()
-    
+    registrations = RegisteredEventRecord.from_rows(cursor.fetchall())
     cursor.close()
     return render_template('main/my_registrations.html', registrations=registrations)
 
@@ -214,27 +325,43 @@ def my_registrations():
 def cancel_registration(event_id):
     cursor = mysql.connection.cursor(MySQLdb.cursors.DictCursor)
     try:
-        # Check if user is registered
+        # Lock the event row first so we take locks in the same order as register_event
+        cursor.execute('SELECT id FROM events WHERE id = %s FOR UPDATE', (event_id,))
+        
         cursor.execute('''
-            SELECT * FROM event_registrations 
+            DELETE FROM event_registrations 
             WHERE event_id = %s AND user_id = %s
         ''', (event_id, current_user.id))
         
-        if cursor.fetchone():
-            # Delete registration
+        if cursor.rowcount:
             cursor.execute('''
-                DELETE FROM event_registrations 
-                WHERE event_id = %s AND user_id = %s
-            ''', (event_id, current_user.id))
+                UPDATE events SET registered_count = registered_count - 1
+                WHERE id = %s
+            ''', (event_id,))
+            registrations_changed(cursor, event_id, cancelled=1)
+            notify_users(cursor, 'registration_cancelled', event_id, [current_user.id])
+            promote_waitlist(cursor, event_id)
             mysql.connection.commit()
+            invalidate_seats(event_id)
+            seat_publisher.notify(event_id)
             flash('Your registration has been cancelled successfully.', 'success')
         else:
+            cursor.execute('''
+                DELETE FROM event_waitlist 
+                WHERE event_id = %s AND user_id = %s
+            ''', (event_id, current_user.id))
+            if cursor.rowcount:
+                mysql.connection.commit()
+                flash('You have left the waitlist.', 'success')
+                return redirect(url_for('main.event_details', event_id=event_id))
+            mysql.connection.rollback()
             flash('You are not registered for this event.', 'error')
             
-    except Exception as e:
+    except Exception:
+        logger.exception('Error cancelling registration for event %s', event_id)
         mysql.connection.rollback()
         flash('An error occurred while cancelling your registration.', 'error')
     finally:
         cursor.close()
     
-    return redirect(url_for('main.my_registrations')) 
\ No newline at end of file
+    return redirect(url_for('main.my_registrations'))
@@ -12,6 +12,7 @@ def get_local_ip():
     except:
         return "127.0.0.1"
 
+# Development server; in production run gunicorn -c gunicorn.conf.py wsgi:app
 if __name__ == '__main__':
     app = create_app()
     local_ip = get_local_ip()
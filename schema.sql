@@ -21,13 +21,25 @@ CREATE TABLE IF NOT EXISTS events (
     time TIME NOT NULL,
     location VARCHAR(200) NOT NULL,
     capacity INT NOT NULL,
+    registered_count INT NOT NULL DEFAULT 0,
+    version INT UNSIGNED NOT NULL DEFAULT 1,
     image_url VARCHAR(255),
     status ENUM('draft', 'published', 'cancelled') DEFAULT 'published',
     created_by INT,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    FOREIGN KEY (created_by) REFERENCES users(id)
+    source_request_id INT,
+    FOREIGN KEY (created_by) REFERENCES users(id),
+    UNIQUE KEY uq_events_source_request (source_request_id),
+    KEY idx_events_status_date_time (status, date, time),
+    KEY idx_events_date (date),
+    FULLTEXT KEY ft_events_search (title, description, location)
 ) CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci;
 
+-- Bumps events.version on every change, which the JSON API's ETags are built from
+DROP TRIGGER IF EXISTS events_bump_version;
+CREATE TRIGGER events_bump_version BEFORE UPDATE ON events
+FOR EACH ROW SET NEW.version = OLD.version + 1;
+
 -- Event registrations table
 CREATE TABLE IF NOT EXISTS event_registrations (
     id INT AUTO_INCREMENT PRIMARY KEY,
@@ -37,7 +49,68 @@ CREATE TABLE IF NOT EXISTS event_registrations (
     status ENUM('pending', 'confirmed', 'cancelled') DEFAULT 'confirmed',
     FOREIGN KEY (event_id) REFERENCES events(id),
     FOREIGN KEY (user_id) REFERENCES users(id),
-    UNIQUE KEY unique_registration (event_id, user_id)
+    UNIQUE KEY unique_registration (event_id, user_id),
+    KEY idx_registrations_user (user_id, event_id),
+    KEY idx_registrations_event_date (event_id, registration_date)
+) CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci;
+
+-- Waitlist for full events, promoted in FIFO (id) order
+CREATE TABLE IF NOT EXISTS event_waitlist (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    event_id INT NOT NULL,
+    user_id INT NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (event_id) REFERENCES events(id),
+    FOREIGN KEY (user_id) REFERENCES users(id),
+    UNIQUE KEY unique_waitlist (event_id, user_id),
+    KEY idx_waitlist_event_order (event_id, id)
+) CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci;
+
+-- Content-addressed uploads (<sha256>.<ext>) shared by events and requests
+CREATE TABLE IF NOT EXISTS upload_blobs (
+    filename VARCHAR(255) PRIMARY KEY,
+    size INT NOT NULL DEFAULT 0,
+    ref_count INT NOT NULL DEFAULT 0,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+) CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci;
+
+-- Precomputed dashboard figures (see stats.py)
+CREATE TABLE IF NOT EXISTS event_date_stats (
+    date DATE PRIMARY KEY,
+    events INT NOT NULL DEFAULT 0,
+    capacity INT NOT NULL DEFAULT 0,
+    registered INT NOT NULL DEFAULT 0
+) CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci;
+
+CREATE TABLE IF NOT EXISTS registration_daily_stats (
+    day DATE NOT NULL,
+    event_id INT NOT NULL,
+    registrations INT NOT NULL DEFAULT 0,
+    cancellations INT NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, event_id)
+) CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci;
+
+CREATE TABLE IF NOT EXISTS stats_counters (
+    name VARCHAR(64) PRIMARY KEY,
+    value BIGINT NOT NULL DEFAULT 0
+) CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci;
+
+-- Queued notification e-mails, sent by notifications.py
+CREATE TABLE IF NOT EXISTS notification_jobs (
+    id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    kind VARCHAR(50) NOT NULL,
+    user_id INT NULL,
+    recipient VARCHAR(120) NOT NULL,
+    payload JSON NOT NULL,
+    status ENUM('pending', 'sent', 'failed') NOT NULL DEFAULT 'pending',
+    attempts INT NOT NULL DEFAULT 0,
+    run_after DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    last_error VARCHAR(500),
+    dedupe_key VARCHAR(100) NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    sent_at DATETIME NULL,
+    UNIQUE KEY uq_notification_dedupe (dedupe_key),
+    KEY idx_notification_due (status, run_after)
 ) CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci;
 
 -- Event requests table
@@ -54,7 +127,10 @@ CREATE TABLE IF NOT EXISTS event_requests (
     admin_remarks TEXT,
     image_url VARCHAR(255),
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    FOREIGN KEY (requested_by) REFERENCES users(id)
+    FOREIGN KEY (requested_by) REFERENCES users(id),
+    KEY idx_requests_requester_created (requested_by, created_at),
+    KEY idx_requests_created (created_at),
+    KEY idx_requests_status (status)
 ) CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci;
 
 -- Insert default admin user (password: admin123)
@@ -88,4 +164,4 @@ VALUES
 ALTER TABLE event_requests ADD COLUMN image_url VARCHAR(255);
 
 -- Update the events table
-ALTER TABLE events ADD COLUMN image_url VARCHAR(255); 
\ No newline at end of file
+ALTER TABLE events ADD COLUMN image_url VARCHAR(255);
@@ -0,0 +1,52 @@
+import re
+
+from pagination import keyset_page
+
+# Words of 2+ letters/digits only, so user input can't inject
+# boolean operators (+ - " ~ < > ( ) *) into the MATCH expression
+TERM_RE = re.compile(r'\w{2,}', re.UNICODE)
+MAX_TERMS = 8
+SUGGEST_LIMIT = 8
+MATCH_COLUMNS = 'title, description, location'
+
+
+def boolean_query(text):
+    """Turn free text into a BOOLEAN MODE query: every word required, as a prefix.
+
+    'robot work' -> '+robot* +work*', so partially typed words still match.
+    Returns '' when there is nothing to search for.
+    """
+    terms = TERM_RE.findall(text or '')[:MAX_TERMS]
+    return ' '.join(f'+{term}*' for term in terms)
+
+
+def search_events(cursor, text, per_page, after=None, before=None):
+    # Ranked by relevance, then id; the keyset cursor carries (score, id)
+    query = boolean_query(text)
+    if not query:
+        return None
+    select = f'''
+        SELECT * FROM (
+            SELECT e.*, MATCH({MATCH_COLUMNS}) AGAINST (%s IN BOOLEAN MODE) AS score
+            FROM events e
+            WHERE MATCH({MATCH_COLUMNS}) AGAINST (%s IN BOOLEAN MODE)
+            AND e.status = 'published' AND e.date >= CURDATE()
+        ) ranked
+    '''
+    return keyset_page(cursor, select, [('score', 'score'), ('id', 'id')],
+                       params=[query, query], per_page=per_page,
+                       after=after, before=before)
+
+
+def suggest_titles(cursor, text, limit=SUGGEST_LIMIT):
+    query = boolean_query(text)
+    if not query:
+        return []
+    cursor.execute(f'''
+        SELECT id, title FROM events
+        WHERE MATCH({MATCH_COLUMNS}) AGAINST (%s IN BOOLEAN MODE)
+        AND status = 'published' AND date >= CURDATE()
+        ORDER BY MATCH({MATCH_COLUMNS}) AGAINST (%s IN BOOLEAN MODE) DESC, id DESC
+        LIMIT %s
+    ''', (query, query, limit))
+    return cursor.fetchall()
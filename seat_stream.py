@@ -0,0 +1,279 @@
+"""Live seat counts pushed to browsers over Server-Sent Events.
+
+One publisher thread per worker process watches the events that someone in
+this process is subscribed to. It wakes when register_event or
+cancel_registration calls notify(), waits a moment so a burst of
+registrations turns into a single update, and reads every watched event's
+seats in one query. It also polls every SEAT_STREAM_POLL_INTERVAL seconds
+to pick up changes made through other workers. Each update is handed to
+the subscribers of that event, and a subscriber only keeps the latest
+count per event, so a slow client never builds up a backlog.
+
+A stream holds one connection open until SEAT_STREAM_MAX_AGE; browsers
+reconnect on their own. Under gevent workers (GUNICORN_WORKER_CLASS=gevent)
+each idle client costs a greenlet. Under the default threaded workers it
+ties up a request thread, so there a worker takes at most
+SEAT_STREAM_THREADED_MAX_CLIENTS streams and pages leave out the script
+that opens them, unless SEAT_STREAM_PAGES says the stream URLs are routed
+to a separate gevent deployment.
+
+mysqlclient does its socket I/O in C, where gevent can't switch away, so
+under gevent the publisher runs its query on a real thread from the hub's
+threadpool, over a connection of its own rather than one from the pool.
+"""
+import json
+import logging
+import os
+import threading
+import time
+
+import MySQLdb
+import MySQLdb.cursors
+from flask import Response
+
+from page_cache import seat_cache
+
+logger = logging.getLogger(__name__)
+
+
+class StreamsFull(Exception):
+    pass
+
+
+def gevent_patched():
+    try:
+        from gevent import monkey
+    except ImportError:
+        return False
+    return monkey.is_module_patched('socket')
+
+
+class Subscriber:
+    __slots__ = ('event_ids', 'pending', 'wakeup', 'lock', 'closed')
+
+    def __init__(self, event_ids):
+        self.event_ids = event_ids
+        self.closed = False
+        self.pending = {}  # event id -> seats left; only the latest value is kept
+        self.wakeup = threading.Event()
+        self.lock = threading.Lock()
+
+    def push(self, event_id, seats):
+        with self.lock:
+            self.pending[event_id] = seats
+        self.wakeup.set()
+
+    def wait(self, timeout):
+        self.wakeup.wait(timeout)
+        self.wakeup.clear()
+        with self.lock:
+            pending, self.pending = self.pending, {}
+        return pending
+
+
+class SeatPublisher:
+    def __init__(self, poll_interval=2.0, coalesce=0.25, max_clients=5000, keepalive=15, max_age=300):
+        self.poll_interval = poll_interval
+        self.coalesce = coalesce
+        self.max_clients = max_clients
+        self.keepalive = keepalive
+        self.max_age = max_age
+        self.cooperative = False
+        self._connect_kwargs = None
+        self._conn = None
+        self._lock = threading.Lock()
+        self._subscribers = {}  # event id -> set of Subscriber
+        self._latest = {}  # event id -> seats left, as last published
+        self._wake = threading.Event()
+        self._thread = None
+        self._pid = None
+
+        self.clients = 0
+        self.queries = 0
+        self.updates = 0
+        self.deliveries = 0
+        self.rejected = 0
+
+    def init_app(self, app):
+        config = app.config
+        self.poll_interval = config.get('SEAT_STREAM_POLL_INTERVAL', self.poll_interval)
+        self.coalesce = config.get('SEAT_STREAM_COALESCE', self.coalesce)
+        self.keepalive = config.get('SEAT_STREAM_KEEPALIVE', self.keepalive)
+        self.max_age = config.get('SEAT_STREAM_MAX_AGE', self.max_age)
+        # Loaded by a gevent worker, or after gunicorn.conf.py patched the
+        # master; either way before any stream is served
+        self.cooperative = gevent_patched()
+        if self.cooperative:
+            self.max_clients = config.get('SEAT_STREAM_MAX_CLIENTS', self.max_clients)
+        else:
+            self.max_clients = config.get('SEAT_STREAM_THREADED_MAX_CLIENTS', 2)
+        pages = config.get('SEAT_STREAM_PAGES')
+        app.jinja_env.globals['live_seats'] = self.cooperative if pages is None else pages
+        # The primary's settings: counts must be current
+        self._connect_kwargs = app.extensions['mysql_pool'].connect_kwargs
+        app.extensions['seat_publisher'] = self
+
+    def _ensure_started(self):
+        # One publisher per process; a thread doesn't survive a fork
+        with self._lock:
+            if self._thread is None or self._pid != os.getpid():
+                self._subscribers.clear()
+                self._latest.clear()
+                self.clients = 0
+                # The parent's connection belongs to the parent
+                self._conn = None
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name='seat-publisher', daemon=True)
+                self._thread.start()
+
+    def subscribe(self, event_ids):
+        self._ensure_started()
+        subscriber = Subscriber(frozenset(event_ids))
+        with self._lock:
+            if self.clients >= self.max_clients:
+                self.rejected += 1
+                raise StreamsFull()
+            self.clients += 1
+            unknown = False
+            for event_id in subscriber.event_ids:
+                self._subscribers.setdefault(event_id, set()).add(subscriber)
+                if event_id in self._latest:
+                    subscriber.pending[event_id] = self._latest[event_id]
+                else:
+                    unknown = True
+        if unknown:
+            self._wake.set()
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            if subscriber.closed or self._pid != os.getpid():
+                return
+            subscriber.closed = True
+            self.clients -= 1
+            for event_id in subscriber.event_ids:
+                watchers = self._subscribers.get(event_id)
+                if watchers is None:
+                    continue
+                watchers.discard(subscriber)
+                if not watchers:
+                    del self._subscribers[event_id]
+                    self._latest.pop(event_id, None)
+
+    def notify(self, event_id):
+        """Called after a commit that changed the event's seats."""
+        # Other processes' subscribers see it on their next poll
+        if event_id in self._subscribers:
+            self._wake.set()
+
+    def _run(self):
+        while True:
+            if self._wake.wait(self.poll_interval):
+                # Let the rest of a registration burst land in the same update
+                time.sleep(self.coalesce)
+            self._wake.clear()
+            with self._lock:
+                event_ids = list(self._subscribers)
+            if not event_ids:
+                continue
+            try:
+                if self.cooperative:
+                    # Blocks this greenlet only, not the whole worker
+                    from gevent import get_hub
+                    rows = get_hub().threadpool.apply(self._fetch, (event_ids,))
+                else:
+                    rows = self._fetch(event_ids)
+            except MySQLdb.Error as e:
+                logger.warning('Seat publisher query failed: %s', e)
+                continue
+            self._publish(rows)
+
+    def _fetch(self, event_ids):
+        # Not from the pool: under gevent its locks are greenlet locks, which
+        # a threadpool thread must not take. Only this method uses the
+        # connection, one call at a time.
+        if self._conn is None:
+            self._conn = MySQLdb.connect(**self._connect_kwargs)
+            # Each query sees the latest commits, not one long-lived snapshot
+            self._conn.autocommit(True)
+        try:
+            cursor = self._conn.cursor(MySQLdb.cursors.DictCursor)
+            cursor.execute(
+                'SELECT id, capacity - registered_count AS seats FROM events WHERE id IN (%s)'
+                % ', '.join(['%s'] * len(event_ids)),
+                event_ids
+            )
+            rows = cursor.fetchall()
+            cursor.close()
+            return rows
+        except MySQLdb.OperationalError:
+            # Reconnect on the next round
+            try:
+                self._conn.close()
+            except MySQLdb.Error:
+                pass
+            self._conn = None
+            raise
+        finally:
+            self.queries += 1
+
+    def _publish(self, rows):
+        deliveries = []
+        with self._lock:
+            for row in rows:
+                event_id, seats = row['id'], row['seats']
+                seat_cache.set(event_id, seats)
+                if self._latest.get(event_id) == seats:
+                    continue
+                self._latest[event_id] = seats
+                self.updates += 1
+                deliveries.extend((subscriber, event_id, seats)
+                                  for subscriber in self._subscribers.get(event_id, ()))
+            self.deliveries += len(deliveries)
+        # Outside the publisher lock: pushing only touches each subscriber's own
+        for subscriber, event_id, seats in deliveries:
+            subscriber.push(event_id, seats)
+
+    def stream(self, subscriber):
+        # Browsers retry after this many milliseconds if the stream drops
+        yield 'retry: 3000\n\n'
+        deadline = time.monotonic() + self.max_age
+        while time.monotonic() < deadline:
+            updates = subscriber.wait(self.keepalive)
+            if not updates:
+                yield ': keepalive\n\n'
+                continue
+            # All pending updates go out in one write
+            yield ''.join(
+                f'event: seats\ndata: {json.dumps({"id": event_id, "seats": seats})}\n\n'
+                for event_id, seats in updates.items())
+
+    def response(self, event_ids):
+        try:
+            subscriber = self.subscribe(event_ids)
+        except StreamsFull:
+            return Response('Too many live streams, try again shortly\n', status=503,
+                            headers={'Retry-After': '10'}, mimetype='text/plain')
+        response = Response(self.stream(subscriber), mimetype='text/event-stream', headers={
+            'Cache-Control': 'no-cache',
+            # Stop nginx from buffering the stream
+            'X-Accel-Buffering': 'no',
+        })
+        # The server closes the response when the client goes away, even if
+        # the stream never started
+        response.call_on_close(lambda: self.unsubscribe(subscriber))
+        return response
+
+    def stats(self):
+        with self._lock:
+            return {
+                'clients': self.clients,
+                'watched_events': len(self._subscribers),
+                'queries': self.queries,
+                'updates': self.updates,
+                'deliveries': self.deliveries,
+                'rejected': self.rejected,
+            }
+
+
+seat_publisher = SeatPublisher()
@@ -0,0 +1,38 @@
+"""Split .sql scripts (schema.sql, migrations/*.sql) into statements.
+
+Comments and quoted strings are recognised before splitting, so a ';'
+inside either never ends a statement. There is no DELIMITER support:
+scripts must not define procedures or multi-statement triggers.
+"""
+import re
+
+TOKEN_RE = re.compile(r'''
+    '(?:[^'\\]|\\.)*'                # string
+  | "(?:[^"\\]|\\.)*"                # string, or identifier in ANSI mode
+  | `[^`]*`                          # identifier
+  | (?P<line>(?:--(?=\s|\Z)|\#)[^\n]*)
+  | (?P<block>/\*.*?\*/)
+  | (?P<end>;)
+  | [^'"`\#;/-]+
+  | .
+''', re.S | re.X)
+
+
+def split_statements(sql):
+    """Yield each statement in the script, stripped, without its comments."""
+    parts = []
+    for match in TOKEN_RE.finditer(sql):
+        if match.group('line'):
+            continue
+        if match.group('block'):
+            parts.append(' ')
+        elif match.group('end'):
+            statement = ''.join(parts).strip()
+            if statement:
+                yield statement
+            parts = []
+        else:
+            parts.append(match.group())
+    statement = ''.join(parts).strip()
+    if statement:
+        yield statement
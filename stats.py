@@ -0,0 +1,118 @@
+# Precomputed dashboard figures, kept up to date by the write paths:
+# event_date_stats has one row per event date (published events, capacity,
+# registrations), registration_daily_stats counts registrations and
+# cancellations per day and event, and stats_counters holds single values.
+# The helpers run inside the caller's transaction after the events row has
+# been locked, so a date row is always locked after its event row.
+
+from datetime import date, timedelta
+
+TIMESERIES_DAYS = 30
+
+_ADD_TO_DATE = '''
+    INSERT INTO event_date_stats (date, events, capacity, registered)
+    VALUES (%s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE events = events + VALUES(events),
+                            capacity = capacity + VALUES(capacity),
+                            registered = registered + VALUES(registered)
+'''
+
+
+def _contribution(event, sign):
+    if not event or event['status'] != 'published':
+        return None
+    return (event['date'], sign, sign * int(event['capacity']), sign * int(event['registered_count']))
+
+
+def events_changed(cursor, changes):
+    """Apply a list of (before, after) event rows; either side may be None.
+
+    Rows need date, status, capacity and registered_count.
+    """
+    entries = []
+    for before, after in changes:
+        entries += [entry for entry in (_contribution(before, -1), _contribution(after, 1)) if entry]
+    if entries:
+        cursor.executemany(_ADD_TO_DATE, entries)
+
+
+def event_changed(cursor, before, after):
+    events_changed(cursor, [(before, after)])
+
+
+def registrations_changed(cursor, event_id, registered=0, cancelled=0):
+    if not registered and not cancelled:
+        return
+    cursor.execute('''
+        UPDATE event_date_stats s JOIN events e ON e.date = s.date
+        SET s.registered = s.registered + %s
+        WHERE e.id = %s AND e.status = 'published'
+    ''', (registered - cancelled, event_id))
+    cursor.execute('''
+        INSERT INTO registration_daily_stats (day, event_id, registrations, cancellations)
+        VALUES (CURDATE(), %s, %s, %s)
+        ON DUPLICATE KEY UPDATE registrations = registrations + VALUES(registrations),
+                                cancellations = cancellations + VALUES(cancellations)
+    ''', (event_id, registered, cancelled))
+
+
+def counter_changed(cursor, name, delta):
+    cursor.execute('''
+        INSERT INTO stats_counters (name, value) VALUES (%s, %s)
+        ON DUPLICATE KEY UPDATE value = value + VALUES(value)
+    ''', (name, delta))
+
+
+def dashboard_stats(cursor):
+    # Reads one row per event date and one row per day, however many events
+    # and registrations there are
+    cursor.execute('''
+        SELECT COALESCE(SUM(events), 0) as total_events,
+            COALESCE(SUM(CASE WHEN date >= CURDATE() THEN events END), 0) as upcoming_events,
+            COALESCE(SUM(CASE WHEN date < CURDATE() THEN events END), 0) as past_events,
+            COALESCE(SUM(CASE WHEN date >= CURDATE() THEN capacity END), 0) as upcoming_capacity,
+            COALESCE(SUM(CASE WHEN date >= CURDATE() THEN registered END), 0) as upcoming_registered
+        FROM event_date_stats
+    ''')
+    event_stats = cursor.fetchone()
+    capacity = event_stats['upcoming_capacity']
+    event_stats['fill_rate'] = round(100 * event_stats['upcoming_registered'] / capacity) if capacity else 0
+
+    cursor.execute("SELECT value FROM stats_counters WHERE name = 'pending_requests'")
+    row = cursor.fetchone()
+    request_stats = {'pending_requests': row['value'] if row else 0}
+
+    cursor.execute('''
+        SELECT day, SUM(registrations) as registrations, SUM(cancellations) as cancellations
+        FROM registration_daily_stats
+        WHERE day > CURDATE() - INTERVAL %s DAY
+        GROUP BY day
+        ORDER BY day
+    ''', (TIMESERIES_DAYS,))
+    by_day = {row['day']: row for row in cursor.fetchall()}
+    # Days without activity have no rows; show them as zero
+    today = date.today()
+    timeseries = [by_day.get(day, {'day': day, 'registrations': 0, 'cancellations': 0})
+                  for day in (today - timedelta(days=offset) for offset in range(TIMESERIES_DAYS - 1, -1, -1))]
+    return event_stats, request_stats, timeseries
+
+
+def rebuild(cursor):
+    """Recompute event_date_stats and the pending count from the source tables.
+
+    registration_daily_stats can't be rebuilt (cancellations leave no rows);
+    it is only backfilled by the migration.
+    """
+    cursor.execute('DELETE FROM event_date_stats')
+    cursor.execute('''
+        INSERT INTO event_date_stats (date, events, capacity, registered)
+        SELECT date, COUNT(*), SUM(capacity), SUM(registered_count)
+        FROM events
+        WHERE status = 'published'
+        GROUP BY date
+    ''')
+    cursor.execute('''
+        INSERT INTO stats_counters (name, value)
+        SELECT 'pending_requests', COUNT(*) FROM event_requests WHERE status = 'pending'
+        ON DUPLICATE KEY UPDATE value = VALUES(value)
+    ''')
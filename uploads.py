@@ -0,0 +1,149 @@
+import hashlib
+import os
+import re
+import tempfile
+from collections import Counter
+
+from flask import current_app, request
+
+import images
+
+# Uploads are stored as <sha256>.<ext>; renditions keep the hash as prefix
+CONTENT_NAME_RE = re.compile(r'^[0-9a-f]{64}\.[a-z0-9]+$')
+IMMUTABLE_PATH_RE = re.compile(r'^uploads/(?:renditions/)?[0-9a-f]{64}[._]')
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+CHUNK_SIZE = 64 * 1024
+
+
+def init_uploads(app):
+    @app.after_request
+    def cache_content_addressed(response):
+        # A content-addressed file can never change, so let browsers keep it
+        if request.endpoint == 'static' and response.status_code == 200 \
+                and IMMUTABLE_PATH_RE.match(request.view_args.get('filename', '')):
+            response.cache_control.public = True
+            response.cache_control.max_age = IMMUTABLE_MAX_AGE
+            response.cache_control.immutable = True
+        return response
+
+
+def upload_folder():
+    return os.path.join(current_app.root_path, current_app.config['UPLOAD_FOLDER'])
+
+
+def is_content_addressed(filename):
+    return bool(filename and CONTENT_NAME_RE.match(filename))
+
+
+class StagedUpload:
+    __slots__ = ('temp_path', 'filename', 'size')
+
+    def __init__(self, temp_path, filename, size):
+        self.temp_path = temp_path
+        self.filename = filename
+        self.size = size
+
+
+def stage_upload(file_storage, upload_dir, extension):
+    """Copy an upload into a temp file, hashing it on the way.
+
+    Nothing is published until publish_upload() runs, which the caller does
+    after the database reference has been committed. Raises OSError if the
+    file is not a PNG, JPEG or GIF, and Image.DecompressionBombError if it
+    has too many pixels.
+    """
+    return stage_stream(file_storage.stream, upload_dir, extension)
+
+
+def stage_stream(stream, upload_dir, extension):
+    # Named after the bytes as uploaded, so the same file always dedupes to
+    # one blob; images.publish_clean() strips the metadata later
+    digest = hashlib.sha256()
+    size = 0
+    fd, temp_path = tempfile.mkstemp(dir=upload_dir, prefix='.upload-')
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            while True:
+                chunk = stream.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                out.write(chunk)
+                size += len(chunk)
+        images.check_image(temp_path)
+    except Exception:
+        os.unlink(temp_path)
+        raise
+
+    extension = 'jpg' if extension == 'jpeg' else extension
+    return StagedUpload(temp_path, f'{digest.hexdigest()}.{extension}', size)
+
+
+def publish_upload(staged, upload_dir):
+    # The image workers strip the metadata and then publish the file, so
+    # the request doesn't wait for a re-encode. Until they have, the image
+    # is missing from the page.
+    images.schedule_publish(upload_dir, staged.temp_path, staged.filename)
+
+
+def discard_upload(staged):
+    try:
+        os.unlink(staged.temp_path)
+    except OSError:
+        pass
+
+
+def add_reference(cursor, filename, size=0):
+    if not is_content_addressed(filename):
+        return
+    cursor.execute('''
+        INSERT INTO upload_blobs (filename, size, ref_count)
+        VALUES (%s, %s, 1)
+        ON DUPLICATE KEY UPDATE ref_count = ref_count + 1
+    ''', (filename, size))
+
+
+def add_references(cursor, filenames):
+    # Bulk add_reference(): one row per blob, counting repeats
+    counts = Counter(name for name in filenames if is_content_addressed(name))
+    if not counts:
+        return
+    cursor.executemany('''
+        INSERT INTO upload_blobs (filename, size, ref_count)
+        VALUES (%s, 0, %s)
+        ON DUPLICATE KEY UPDATE ref_count = ref_count + VALUES(ref_count)
+    ''', list(counts.items()))
+
+
+def release_reference(cursor, filename):
+    """Drop one reference; returns True if the blob is now orphaned.
+
+    The caller deletes the files with delete_blob() after committing.
+    """
+    if not is_content_addressed(filename):
+        return False
+    cursor.execute('SELECT ref_count FROM upload_blobs WHERE filename = %s FOR UPDATE', (filename,))
+    row = cursor.fetchone()
+    if not row:
+        return False
+    if row['ref_count'] > 1:
+        cursor.execute('UPDATE upload_blobs SET ref_count = ref_count - 1 WHERE filename = %s',
+                       (filename,))
+        return False
+    cursor.execute('DELETE FROM upload_blobs WHERE filename = %s', (filename,))
+    return True
+
+
+def delete_blob(upload_dir, filename):
+    stem = os.path.splitext(filename)[0]
+    rendition_dir = os.path.join(upload_dir, images.RENDITION_DIR)
+    paths = [os.path.join(upload_dir, filename), os.path.join(rendition_dir, stem + '.json')]
+    if os.path.isdir(rendition_dir):
+        paths += [os.path.join(rendition_dir, name) for name in os.listdir(rendition_dir)
+                  if name.startswith(stem + '_')]
+    for path in paths:
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+    images.forget(filename)
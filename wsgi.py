@@ -0,0 +1,6 @@
+# Production entry point:
+#     gunicorn -c gunicorn.conf.py wsgi:app
+from app import create_app, warm_up
+
+app = create_app()
+warm_up(app)